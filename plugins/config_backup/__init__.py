@@ -1,5 +1,4 @@
 from netbox.plugins import PluginConfig
-from .signals import update_device_backup_status
 
 class NetBoxConfigBackupConfig(PluginConfig):
     name = 'netbox_config_backup'
@@ -9,12 +8,64 @@ class NetBoxConfigBackupConfig(PluginConfig):
     author = 'Mansur Kasumov'
     base_url = 'config-backup'
     required_settings = []
-    default_settings = {}
+    # RQ queue netbox_config_backup.collection
+    queues = ['collection']
+    default_settings = {
+        # Scheduled collection concurrency (collect_scheduled_backups)
+        'collection_workers': 1,
+        'per_site_limit': None,
+        'per_manufacturer_limit': None,
+        # Adaptive schedule (seconds): a change multiplies the device interval by schedule_speedup,
+        # no change by schedule_slowdown; failures back off from schedule_retry to schedule_retry_max
+        'schedule_interval': 12 * 3600,
+        'schedule_min_interval': 3600,
+        'schedule_max_interval': 48 * 3600,
+        'schedule_speedup': 0.5,
+        'schedule_slowdown': 1.25,
+        'schedule_retry': 1800,
+        'schedule_retry_max': 7 * 24 * 3600,
+        # Due times are spread by +-10% so runs don't line up
+        'schedule_jitter': 0.1,
+        # A run claims its devices for this long, so an overlapping run skips them;
+        # their collection sets the real due time, devices of a run that died are due again after it
+        'schedule_claim_timeout': 3600,
+        # 'local' collects in the command's own thread pool, 'rq' enqueues one job per device
+        'collection_backend': 'local',
+        # Seconds between retries of a failed device job (one retry per entry)
+        'collection_retry_intervals': [60, 300, 900],
+        'collection_job_timeout': 300,
+        # CollectionRun rows (and their per-device results) older than this are deleted; metrics keep counting
+        'collection_run_retention_days': 30,
+        # Run the RQ queue on an in-process fakeredis (tests only)
+        'rq_fake_redis': False,
+        # Authenticated SSH sessions kept per device between collections in the same process (0 disables reuse)
+        'ssh_pool_idle_timeout': 60,
+        'ssh_pool_max_idle_per_device': 1,
+        # Unchanged lines shown around each change on the compare page (-1 shows the whole file)
+        'diff_context': 3,
+        # Seconds computed diffs stay in the Django cache (eviction beyond that is up to the cache backend)
+        'diff_cache_timeout': 86400,
+        # 'delta' keeps only the newest version of a device in full, older ones as reverse deltas
+        'storage_mode': 'full',
+        # Longest run of deltas before a full snapshot is kept (bounds reconstruction time)
+        'delta_chain_max': 50,
+        # Extra vendor profiles, e.g. [{'key': 'extreme', 'match': ['extreme'], 'config_command': 'show configuration'}]
+        'vendor_profiles': [],
+        # Cold storage (archive_old_backups): configs only referenced by older backups go to pack files
+        'archive_path': '/opt/netbox/netbox/media/config_backup_archive',
+        'archive_after_days': 365,
+        'archive_pack_size': 256 * 1024 * 1024,
+        'archive_compression_level': 9,
+    }
     
     api_urlpatterns = 'netbox_config_backup.api_urls'
 
     def ready(self):
         super().ready()
-#        from .signals import update_device_backup_status
+        from django.db.models.signals import post_migrate
+        from .signals import fill_latest_pointers, update_device_backup_status
+        post_migrate.connect(fill_latest_pointers, sender=self)
+        from .utilities.vendors import register_vendors_from_settings
+        register_vendors_from_settings()
 
 config = NetBoxConfigBackupConfig
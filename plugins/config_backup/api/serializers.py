@@ -1,7 +1,48 @@
 from rest_framework import serializers
-from netbox_config_backup.models import ConfigBackup
+from netbox_config_backup.models import CollectionResult, CollectionRun, ConfigBackup
 
 class ConfigBackupSerializer(serializers.ModelSerializer):
     class Meta:
         model = ConfigBackup
         fields = '__all__'
+
+class ConfigBackupListSerializer(serializers.ModelSerializer):
+    """History listing without the config text: digest and size instead, the text is at /backups/{id}/raw/"""
+    digest = serializers.CharField(source='config_hash', read_only=True)
+    # Stored on the row, listing joins nothing (0 until backfill_config_backups moved the text to the blob store)
+    size = serializers.IntegerField(source='config_size', read_only=True)
+
+    class Meta:
+        model = ConfigBackup
+        fields = (
+            'id', 'device', 'created', 'last_checked', 'last_status', 'status',
+            'collection_mode', 'auto_enabled', 'digest', 'size',
+        )
+
+class CollectionRequestSerializer(serializers.Serializer):
+    """Body of POST /backups/collect/: device ids, or dcim device filters as in /api/dcim/devices/"""
+    devices = serializers.ListField(child=serializers.IntegerField(), required=False, allow_empty=False)
+    filter = serializers.DictField(required=False, allow_empty=False)
+
+    def validate(self, data):
+        if ('devices' in data) == ('filter' in data):
+            raise serializers.ValidationError("Pass either 'devices' or 'filter'")
+        return data
+
+class CollectionResultSerializer(serializers.ModelSerializer):
+    device_name = serializers.CharField(source='device.name', read_only=True)
+
+    class Meta:
+        model = CollectionResult
+        fields = ('device', 'device_name', 'status', 'message', 'backup', 'started', 'finished')
+
+class CollectionRunSerializer(serializers.ModelSerializer):
+    completed = serializers.IntegerField(read_only=True)
+    results = CollectionResultSerializer(many=True, read_only=True)
+
+    class Meta:
+        model = CollectionRun
+        fields = (
+            'id', 'created', 'finished', 'backend', 'source', 'devices', 'skipped',
+            'saved', 'unchanged', 'failed', 'completed', 'results',
+        )
@@ -1,8 +1,164 @@
+import re
+from django.http import HttpResponseNotModified, StreamingHttpResponse
+from django.utils.http import parse_etags
+from rest_framework.decorators import action
+from rest_framework.pagination import CursorPagination
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.response import Response
 from rest_framework.viewsets import ModelViewSet
-from netbox_config_backup.models import ConfigBackup
-from netbox_config_backup.api.serializers import ConfigBackupSerializer
+from dcim.filtersets import DeviceFilterSet
+from dcim.models import Device
+from django.db.models import Prefetch
+from django.http import QueryDict
+from django.shortcuts import get_object_or_404
+from rest_framework.reverse import reverse
+from netbox_config_backup.filtersets import ConfigBackupFilterSet
+from netbox_config_backup.jobs import enqueue_tracked_collection
+from netbox_config_backup.models import CollectionResult, CollectionRun, ConfigBackup, config_digest
+from netbox_config_backup.api.serializers import (
+    ConfigBackupSerializer, ConfigBackupListSerializer, CollectionRequestSerializer, CollectionRunSerializer,
+)
+from netbox_config_backup.utilities.search import SEARCH_LIMIT, SEARCH_MAX_LIMIT, search_latest_configs
 from netbox.api.viewsets import NetBoxModelViewSet  # IMPORTANT
 
+RAW_CHUNK_SIZE = 64 * 1024
+
+class ConfigBackupCursorPagination(CursorPagination):
+    """Keyset pagination: every page is an index range scan on created, however deep"""
+    ordering = '-created'
+    page_size = 100
+    page_size_query_param = 'limit'
+    max_page_size = 1000
+
+class PlainTextRenderer(BaseRenderer):
+    media_type = 'text/plain'
+    format = 'txt'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return data if isinstance(data, bytes) else str(data).encode(self.charset)
+
 class ConfigBackupViewSet(NetBoxModelViewSet):  # ✅ use NetBoxModelViewSet
-    queryset = ConfigBackup.objects.all()
+    queryset = ConfigBackup.objects.select_related('blob')
     serializer_class = ConfigBackupSerializer
+    filterset_class = ConfigBackupFilterSet
+    pagination_class = ConfigBackupCursorPagination
+    # CursorPagination takes the ordering from OrderingFilter, which falls back to this
+    ordering = ('-created',)
+
+    def get_serializer_class(self):
+        if self.action == 'list':
+            return ConfigBackupListSerializer
+        return super().get_serializer_class()
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action in ('list', 'raw'):
+            # No config text: list returns digest and size, raw only reads the text when the ETag doesn't match
+            queryset = queryset.select_related(None).defer('config')
+        return queryset
+
+    @action(detail=True, methods=['get'], renderer_classes=[PlainTextRenderer, JSONRenderer])
+    def raw(self, request, pk=None):
+        """The config as text/plain, streamed; ETag is the SHA-256 digest, If-None-Match gives a 304"""
+        backup = self.get_object()
+        text = None
+        digest = backup.config_hash
+        if not digest:
+            # Not backfilled into the blob store yet
+            text = backup.config or ''
+            digest = config_digest(text)
+        etag = f'"{digest}"'
+        if_none_match = parse_etags(request.headers.get('If-None-Match', ''))
+        if etag in if_none_match or '*' in if_none_match:
+            response = HttpResponseNotModified()
+            response['ETag'] = etag
+            return response
+        if text is None:
+            text = backup.config or ''
+        response = StreamingHttpResponse(
+            (text[start:start + RAW_CHUNK_SIZE].encode() for start in range(0, len(text), RAW_CHUNK_SIZE)),
+            content_type='text/plain; charset=utf-8',
+        )
+        response['ETag'] = etag
+        response['Content-Disposition'] = f'inline; filename="{backup.device_id}-{backup.pk}.txt"'
+        return response
+
+    @action(detail=False, methods=['get'])
+    def search(self, request):
+        """
+        Search the latest backup of every device: ?q=<text>[&regex=true][&limit=N].
+        truncated is true when more than limit devices matched.
+        """
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            return Response({'detail': "Query parameter 'q' is required"}, status=400)
+        regex = request.query_params.get('regex', '').lower() in ('1', 'true', 'on')
+        if regex:
+            try:
+                re.compile(query)
+            except re.error as e:
+                return Response({'detail': f"Invalid regular expression: {e}"}, status=400)
+        try:
+            limit = max(1, min(int(request.query_params.get('limit', SEARCH_LIMIT)), SEARCH_MAX_LIMIT))
+        except ValueError:
+            return Response({'detail': "'limit' must be an integer"}, status=400)
+
+        results, truncated = search_latest_configs(query, regex=regex, limit=limit)
+        return Response({
+            'truncated': truncated,
+            'results': [
+                {
+                    'device': {'id': result['device'].pk, 'name': result['device'].name},
+                    'backup': result['backup_id'],
+                    'created': result['created'],
+                    'matches': [{'line': number, 'text': line} for number, line in result['matches']],
+                }
+                for result in results
+            ],
+        })
+
+    @action(detail=False, methods=['post'])
+    def collect(self, request):
+        """
+        Queue a collection on the RQ workers and return at once (202) with the
+        run id: {"devices": [1, 2]} or {"filter": {"site": "dc1", "role": ["leaf"]}}.
+        """
+        serializer = CollectionRequestSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        devices = Device.objects.restrict(request.user, 'view')
+        if 'devices' in serializer.validated_data:
+            requested = set(serializer.validated_data['devices'])
+            device_ids = list(devices.filter(pk__in=requested).values_list('pk', flat=True))
+            missing = sorted(requested - set(device_ids))
+            if missing:
+                return Response({'devices': f"Unknown device ids: {missing}"}, status=400)
+        else:
+            params = QueryDict(mutable=True)
+            for key, value in serializer.validated_data['filter'].items():
+                params.setlist(key, [str(item) for item in value] if isinstance(value, list) else [str(value)])
+            filterset = DeviceFilterSet(params, devices)
+            if not filterset.is_valid():
+                return Response({'filter': filterset.errors}, status=400)
+            device_ids = list(filterset.qs.values_list('pk', flat=True))
+            if not device_ids:
+                return Response({'filter': "No devices match"}, status=400)
+
+        run = enqueue_tracked_collection(device_ids)
+        data = CollectionRunSerializer(self._get_run(run.pk)).data
+        data['url'] = reverse(
+            'plugins-api:netbox_config_backup-api:configbackup-collect-status', kwargs={'run_id': run.pk}, request=request
+        )
+        return Response(data, status=202)
+
+    @action(detail=False, methods=['get'], url_path=r'collect/(?P<run_id>\d+)')
+    def collect_status(self, request, run_id=None):
+        """Progress of a collection started with POST /backups/collect/: run counters plus one entry per device"""
+        return Response(CollectionRunSerializer(self._get_run(run_id)).data)
+
+    def _get_run(self, run_id):
+        return get_object_or_404(
+            CollectionRun.objects.prefetch_related(
+                Prefetch('results', queryset=CollectionResult.objects.select_related('device'))
+            ),
+            pk=run_id,
+        )
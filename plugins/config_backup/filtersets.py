@@ -0,0 +1,12 @@
+import django_filters
+from .models import ConfigBackup
+
+
+class ConfigBackupFilterSet(django_filters.FilterSet):
+    device_id = django_filters.NumberFilter(field_name='device_id')
+
+    class Meta:
+        model = ConfigBackup
+        fields = {
+            'created': ['gte', 'lte'],
+        }
@@ -0,0 +1,241 @@
+from dcim.models import Device
+from netbox.plugins import get_plugin_config
+from django.utils.timezone import now
+from rq import Queue, Retry, get_current_job
+from rq.exceptions import NoSuchJobError
+from rq.job import Job, JobStatus
+from .models import CollectionResult, CollectionRun, DeviceBackupState
+from .tasks import (
+    PLUGIN_NAME, SCHEDULED_STATUSES, get_backup_credentials, get_scheduled_devices, store_manual_result, store_requested_result,
+    store_scheduled_result,
+)
+from .utilities.backup_utils import backup_device_config
+from .utilities.metrics import CollectionStats
+from .utilities.ssh_pool import get_ssh_pool
+import logging
+
+logger = logging.getLogger("netbox_config_backup")
+
+# Registered by PluginConfig.queues, workers run: manage.py rqworker netbox_config_backup.collection
+QUEUE_NAME = f'{PLUGIN_NAME}.collection'
+
+IN_FLIGHT = (JobStatus.QUEUED, JobStatus.STARTED, JobStatus.DEFERRED, JobStatus.SCHEDULED)
+
+# collection_mode of the jobs started from the UI: Collect Now and the first collection of Collect Auto
+MANUAL_MODES = ('MANUAL', 'AUTO')
+
+_fake_connection = None
+
+
+class CollectionFailed(Exception):
+    """Raised from a job so RQ schedules the next retry"""
+
+
+def get_queue():
+    """The collection queue; on a shared in-process fake Redis when rq_fake_redis is set (tests)"""
+    global _fake_connection
+    if get_plugin_config(PLUGIN_NAME, 'rq_fake_redis'):
+        import fakeredis
+        if _fake_connection is None:
+            _fake_connection = fakeredis.FakeStrictRedis()
+        return Queue(QUEUE_NAME, connection=_fake_connection)
+    import django_rq
+    return django_rq.get_queue(QUEUE_NAME)
+
+
+def get_device_job_id(device_id):
+    # One id per device: a second enqueue finds the first job instead of duplicating it
+    return f'config-backup-device-{device_id}'
+
+
+def get_manual_job_id(device_id, collection_mode='MANUAL'):
+    # Separate from the scheduled job: "Collect Now" always stores a row, the scheduled one only on change.
+    # One per mode, so "Collect Auto" clicked while a "Collect Now" runs still stores its AUTO row.
+    return f'config-backup-{collection_mode.lower()}-{device_id}'
+
+
+def _fetch_job(job_id, queue=None):
+    queue = queue or get_queue()
+    try:
+        return Job.fetch(job_id, connection=queue.connection)
+    except NoSuchJobError:
+        return None
+
+
+def get_device_job(device_id, queue=None):
+    return _fetch_job(get_device_job_id(device_id), queue)
+
+
+def get_manual_job(device_id, queue=None):
+    """The device's job started from the UI: one still in flight if any, else the last one enqueued"""
+    queue = queue or get_queue()
+    jobs = [
+        job for job in Job.fetch_many(
+            [get_manual_job_id(device_id, mode) for mode in MANUAL_MODES], connection=queue.connection
+        ) if job is not None
+    ]
+    for job in jobs:
+        if job.get_status(refresh=False) in IN_FLIGHT:
+            return job
+    return max(jobs, key=lambda job: job.enqueued_at or job.created_at, default=None)
+
+
+def _job_options(device_id):
+    intervals = get_plugin_config(PLUGIN_NAME, 'collection_retry_intervals')
+    return dict(
+        job_id=get_device_job_id(device_id),
+        retry=Retry(max=len(intervals), interval=intervals) if intervals else None,
+        result_ttl=86400,
+        failure_ttl=86400,
+    )
+
+
+def enqueue_manual_collection(device_id, collection_mode='MANUAL'):
+    """Collect Now / Collect Auto from the UI. Repeated clicks of the same one while it runs get the same job back."""
+    queue = get_queue()
+    job_id = get_manual_job_id(device_id, collection_mode)
+    job = _fetch_job(job_id, queue)
+    if job is not None and job.get_status() in IN_FLIGHT:
+        return job
+    return queue.enqueue(
+        collect_manual_job,
+        device_id,
+        collection_mode,
+        job_id=job_id,
+        job_timeout=get_plugin_config(PLUGIN_NAME, 'collection_job_timeout'),
+        result_ttl=3600,
+        failure_ttl=3600,
+    )
+
+
+def enqueue_devices(device_ids, run_id=None, queue=None):
+    """
+    Enqueue one job per device in a single Redis pipeline. Devices whose job
+    is still in flight are left alone. Returns (enqueued ids, skipped ids).
+    """
+    queue = queue or get_queue()
+    device_ids = list(device_ids)
+    # One round trip for the in-flight check instead of one per device
+    existing = Job.fetch_many([get_device_job_id(device_id) for device_id in device_ids], connection=queue.connection)
+    busy = {
+        device_id for device_id, job in zip(device_ids, existing)
+        if job is not None and job.get_status(refresh=False) in IN_FLIGHT
+    }
+    enqueued = [device_id for device_id in device_ids if device_id not in busy]
+    timeout = get_plugin_config(PLUGIN_NAME, 'collection_job_timeout')
+    if enqueued:
+        queue.enqueue_many([
+            Queue.prepare_data(collect_device_job, (device_id, run_id), timeout=timeout, **_job_options(device_id))
+            for device_id in enqueued
+        ])
+    return enqueued, [device_id for device_id in device_ids if device_id in busy]
+
+
+def enqueue_scheduled_backups(due_only=True):
+    """Create a CollectionRun and enqueue one job per scheduled device"""
+    CollectionRun.prune()
+    scheduled, _ = get_scheduled_devices(due_only)
+    # Upper bound first, so early finishing jobs can't close the run before everything is enqueued
+    run = CollectionRun.objects.create(backend='rq', devices=len(scheduled))
+    enqueued, skipped = enqueue_devices([device.pk for device in scheduled], run.pk)
+    CollectionRun.objects.filter(pk=run.pk).update(devices=len(enqueued), skipped=len(skipped))
+    CollectionRun.close_if_complete(run.pk)
+    run.refresh_from_db()
+    return run
+
+
+def enqueue_tracked_collection(device_ids):
+    """
+    Collect the given devices on the RQ workers with per-device progress in
+    CollectionResult rows (the API's bulk collect). Returns the CollectionRun.
+    """
+    device_ids = list(dict.fromkeys(device_ids))
+    run = CollectionRun.objects.create(backend='rq', source='api', devices=len(device_ids))
+    # Rows exist before any job can start and update them
+    CollectionResult.objects.bulk_create([CollectionResult(run=run, device_id=device_id) for device_id in device_ids])
+    enqueued, skipped = enqueue_devices(device_ids, run.pk)
+    if skipped:
+        CollectionResult.objects.filter(run=run, device_id__in=skipped).update(
+            status='skipped', message='A collection for this device is already queued or running', finished=now()
+        )
+    CollectionRun.objects.filter(pk=run.pk).update(devices=len(enqueued), skipped=len(skipped))
+    CollectionRun.close_if_complete(run.pk)
+    run.refresh_from_db()
+    return run
+
+
+def collect_device_job(device_id, run_id=None):
+    """
+    RQ job: collect one device and store the result like the scheduled command
+    does. Runs started through the API (with CollectionResult rows) store it
+    as a manual collection and leave the AUTO schedule alone. A scheduled job
+    for a device whose AUTO backup was turned off meanwhile does nothing.
+    """
+    device = Device.objects.select_related('primary_ip4', 'primary_ip6', 'oob_ip', 'device_type__manufacturer', 'backup_state').filter(pk=device_id).first()
+    if device is None:
+        # Deleted while queued
+        if run_id:
+            CollectionRun.record(run_id, 'failed')
+        return 'failed'
+    # No-ops unless the run was started through the API
+    results = CollectionResult.objects.filter(run_id=run_id, device_id=device_id) if run_id else CollectionResult.objects.none()
+    requested = results.exists()
+    results.filter(started__isnull=True).update(started=now())
+    results.update(status='running')
+    last_hash, latest_status = DeviceBackupState.objects.filter(device_id=device_id).values_list(
+        'latest__config_hash', 'latest__status'
+    ).first() or (None, None)
+    if not requested and latest_status not in SCHEDULED_STATUSES:
+        # Disabled while the job waited in the queue or between retries
+        logger.info(f"⏭️ {device.name}: AUTO backup turned off, not collected")
+        if run_id:
+            CollectionRun.record(run_id, 'skipped')
+        return 'skipped'
+    username, password = get_backup_credentials()
+    stats = CollectionStats()
+    # One job at a time per worker process, so the difference is this collection's
+    pool = get_ssh_pool()
+    pool_before = pool.counters()
+    try:
+        config, status = backup_device_config(device, username, password, stats)
+    except Exception as e:
+        config, status = None, f"Collection failed: {str(e)}"
+    pool_counters = pool.counters_since(pool_before)
+
+    job = get_current_job()
+    if not config and job is not None and job.retries_left:
+        # Not counted yet, the run only sees the final attempt; its connections are
+        logger.warning(f"🔁 {device.name}: {status}, {job.retries_left} retries left")
+        results.update(message=f"{status[:200]} ({job.retries_left} retries left)")
+        if run_id:
+            CollectionRun.record_pool(run_id, pool_counters)
+        raise CollectionFailed(status)
+
+    if requested:
+        outcome = store_requested_result(device, config, status, last_hash)
+    else:
+        outcome = store_scheduled_result(device, config, status, last_hash, stats=stats)
+    results.update(
+        status=outcome,
+        message=status[:255],
+        backup_id=DeviceBackupState.objects.filter(device_id=device_id).values_list('latest_id', flat=True).first(),
+        finished=now(),
+    )
+    if run_id:
+        CollectionRun.record(run_id, outcome, stats, pool_counters)
+    return outcome
+
+
+def collect_manual_job(device_id, collection_mode='MANUAL'):
+    """RQ job behind Collect Now: one attempt, the result (success or not) is always stored"""
+    device = Device.objects.select_related('primary_ip4', 'primary_ip6', 'oob_ip', 'device_type__manufacturer', 'backup_state').filter(pk=device_id).first()
+    if device is None:
+        return None
+    username, password = get_backup_credentials()
+    try:
+        config, status = backup_device_config(device, username, password)
+    except Exception as e:
+        config, status = None, f"Collection failed: {str(e)}"
+    backup = store_manual_result(device, config, status, collection_mode)
+    logger.info(f"📥 {device.name}: {collection_mode.lower()} collection stored ({status})")
+    return backup.pk
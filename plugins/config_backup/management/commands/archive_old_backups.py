@@ -0,0 +1,44 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.utils.timezone import now
+from netbox.plugins import get_plugin_config
+from netbox_config_backup.utilities.archive import archive_blobs, get_archive_path
+import logging
+
+logger = logging.getLogger(__name__)
+
+class Command(BaseCommand):
+    help = 'Move configs of old backups out of the database into compressed pack files'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--older-than',
+            type=int,
+            help='Archive configs only used by backups older than this many days (default: archive_after_days setting)'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only report how many configs would be archived'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=200,
+            help='Number of configs written per transaction'
+        )
+
+    def handle(self, *args, **options):
+        days = options['older_than']
+        if days is None:
+            days = get_plugin_config('netbox_config_backup', 'archive_after_days')
+        cutoff = now() - timedelta(days=days)
+
+        if options['dry_run']:
+            count, size = archive_blobs(cutoff, dry_run=True)
+            logger.info(f"DRY RUN: Would archive {count} configs ({size} bytes) older than {days} days")
+            return f"Dry run complete. Would archive {count} configs."
+
+        count, size = archive_blobs(cutoff, batch_size=options['batch_size'])
+        logger.info(f"TOTAL ARCHIVED: {count} configs ({size} bytes) to {get_archive_path()}")
+        return f"Archive complete. Archived {count} configs."
@@ -0,0 +1,130 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import OuterRef, Subquery
+from netbox_config_backup.models import ConfigBackup, ConfigBlob, DeviceBackupState, config_digest
+from netbox_config_backup.utilities.diff_utils import line_changes
+import logging
+
+logger = logging.getLogger(__name__)
+
+class Command(BaseCommand):
+    help = 'Move config text stored inline on backups into the deduplicated blob store'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only report how many rows and distinct configs would be moved'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Number of backups moved per transaction'
+        )
+        parser.add_argument(
+            '--line-changes',
+            action='store_true',
+            help='Also compute lines added/removed for the history table (diffs every stored version)'
+        )
+        parser.add_argument(
+            '--deltas',
+            action='store_true',
+            help='Also store existing history as reverse deltas (see storage_mode)'
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        pending = ConfigBackup.objects.filter(blob__isnull=True).exclude(config='')
+
+        if options['dry_run']:
+            digests = set()
+            rows = 0
+            for text in pending.values_list('config', flat=True).iterator(chunk_size=batch_size):
+                digests.add(config_digest(text))
+                rows += 1
+            logger.info(f"DRY RUN: Would move {rows} backups into {len(digests)} blobs")
+            return f"Dry run complete. {rows} backups, {len(digests)} distinct configs."
+
+        moved = 0
+        while True:
+            batch = list(pending.order_by('pk').values_list('pk', 'config')[:batch_size])
+            if not batch:
+                break
+            with transaction.atomic():
+                for pk, text in batch:
+                    blob = ConfigBlob.intern(text)
+                    # update() skips save()/signals, nothing but the storage changes
+                    ConfigBackup.objects.filter(pk=pk).update(blob=blob, config_hash=blob.digest, config='')
+            moved += len(batch)
+            logger.info(f"Moved {moved} backups into the blob store")
+
+        # Rows that reached the blob store before config_hash existed
+        hashed = ConfigBackup.objects.filter(config_hash='', blob__isnull=False).update(
+            config_hash=Subquery(ConfigBlob.objects.filter(pk=OuterRef('blob_id')).values('digest')[:1])
+        )
+        if hashed:
+            logger.info(f"Filled config_hash for {hashed} backups")
+
+        sized = ConfigBackup.objects.filter(config_size=0, blob__isnull=False).update(
+            config_size=Subquery(ConfigBlob.objects.filter(pk=OuterRef('blob_id')).values('size')[:1])
+        )
+        if sized:
+            logger.info(f"Filled config_size for {sized} backups")
+
+        if options['line_changes']:
+            counted = self.count_line_changes()
+            logger.info(f"Computed line changes for {counted} backups")
+
+        devices = DeviceBackupState.refresh()
+        logger.info(f"Rebuilt latest-backup pointers for {devices} devices")
+
+        if options['deltas']:
+            converted = self.convert_to_deltas()
+            logger.info(f"Stored {converted} older configs as deltas")
+
+        blobs = ConfigBlob.objects.count()
+        logger.info(f"TOTAL MOVED: {moved} backups, {blobs} blobs in store")
+        return f"Backfill complete. Moved {moved} backups, {blobs} blobs in store."
+
+    def convert_to_deltas(self):
+        """Replay every device history oldest first, as if it had been collected in delta mode"""
+        latest_blobs = set(DeviceBackupState.objects.values_list('latest__blob_id', flat=True))
+        converted = 0
+        devices = ConfigBackup.objects.order_by('device_id').values_list('device_id', flat=True).distinct()
+        for device_id in devices:
+            blob_ids = list(
+                ConfigBackup.objects.filter(device_id=device_id, blob__isnull=False)
+                .order_by('created').values_list('blob_id', flat=True)
+            )
+            with transaction.atomic():
+                for older_id, newer_id in zip(blob_ids, blob_ids[1:]):
+                    if older_id == newer_id or older_id in latest_blobs:
+                        continue
+                    older = ConfigBlob.objects.get(pk=older_id)
+                    converted += older.store_as_delta(ConfigBlob.objects.get(pk=newer_id))
+        return converted
+
+    def count_line_changes(self):
+        """Diff every device history oldest first and store lines added/removed on each version"""
+        counted = 0
+        devices = ConfigBackup.objects.order_by('device_id').values_list('device_id', flat=True).distinct()
+        for device_id in devices:
+            rows = list(
+                ConfigBackup.objects.filter(device_id=device_id, blob__isnull=False)
+                .order_by('created', 'pk').values_list('pk', 'blob_id')
+            )
+            texts = {}
+            with transaction.atomic():
+                for (_, older_blob), (pk, newer_blob) in zip(rows, rows[1:]):
+                    if older_blob == newer_blob:
+                        added = removed = 0
+                    else:
+                        for blob_id in (older_blob, newer_blob):
+                            if blob_id not in texts:
+                                texts[blob_id] = ConfigBlob.objects.get(pk=blob_id).get_text()
+                        added, removed = line_changes(texts[older_blob], texts[newer_blob])
+                        texts.pop(older_blob)  # Histories are walked once, keep only the current text
+                    ConfigBackup.objects.filter(pk=pk).update(lines_added=added, lines_removed=removed)
+                    counted += 1
+        return counted
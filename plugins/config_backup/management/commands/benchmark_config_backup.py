@@ -0,0 +1,150 @@
+from dcim.models import Device
+from django.core.management.base import BaseCommand
+from netbox.plugins import get_plugin_config
+from netbox_config_backup.utilities.benchmarks import benchmark_archive, benchmark_delta, benchmark_collection, benchmark_clean, benchmark_capture
+import logging
+
+logger = logging.getLogger("netbox_config_backup")
+
+SUITES = ('archive', 'delta', 'collection', 'clean', 'capture')
+
+class Command(BaseCommand):
+    help = 'Measure storage and performance characteristics of the backup store'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--suite',
+            choices=SUITES,
+            action='append',
+            help='Benchmark to run (repeatable, default: all)'
+        )
+        parser.add_argument(
+            '--samples',
+            type=int,
+            default=200,
+            help='Number of configs sampled per measurement'
+        )
+        parser.add_argument(
+            '--versions',
+            type=int,
+            default=2000,
+            help='Length of the synthetic history for the delta suite'
+        )
+        parser.add_argument(
+            '--device',
+            type=int,
+            help='Device the delta suite saves its history for, rolled back afterwards (default: the first one)'
+        )
+        parser.add_argument(
+            '--size-mb',
+            type=float,
+            default=8,
+            help='Size of the raw output cleaned by the clean suite'
+        )
+        parser.add_argument(
+            '--devices',
+            type=int,
+            default=50,
+            help='Simulated devices for the collection and capture suites'
+        )
+        parser.add_argument(
+            '--lines',
+            type=int,
+            default=2000,
+            help='Config lines per simulated device'
+        )
+        parser.add_argument(
+            '--latency',
+            type=float,
+            default=0.02,
+            help='Seconds a simulated device waits before answering each command'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=10,
+            help='Concurrent collections for the parallel path'
+        )
+        parser.add_argument(
+            '--failure',
+            choices=['refuse', 'auth', 'hang', 'drop'],
+            help='Failure injected into simulated devices'
+        )
+        parser.add_argument(
+            '--failure-rate',
+            type=float,
+            default=0.0,
+            help='Share of connections that fail with --failure'
+        )
+
+    def handle(self, *args, **options):
+        for suite in options['suite'] or SUITES:
+            getattr(self, f'run_{suite}')(options)
+
+    def run_archive(self, options):
+        result = benchmark_archive(options['samples'])
+        for table, size in result['sizes'].items():
+            logger.info(f"💾 {table}: {size / 1024 / 1024:.1f} MiB")
+        for label in ('inline', 'archived'):
+            stats = result[label]
+            logger.info(
+                f"📖 {label}: {stats['count']} configs ({stats['bytes'] / 1024 / 1024:.1f} MiB of text), "
+                f"read p50 {stats['p50'] * 1000:.2f} ms, p99 {stats['p99'] * 1000:.2f} ms over {stats['reads']} reads"
+            )
+
+    def run_delta(self, options):
+        chain_max = get_plugin_config('netbox_config_backup', 'delta_chain_max')
+        devices = Device.objects.order_by('pk')
+        device = devices.filter(pk=options['device']).first() if options['device'] else devices.first()
+        if device is None:
+            logger.warning("⚠️ Delta suite skipped: no device to save the history for")
+            return
+        result = benchmark_delta(device, options['versions'], chain_max, options['samples'])
+        saved = 1 - result['stored_bytes'] / result['full_bytes'] if result['full_bytes'] else 0
+        logger.info(
+            f"💾 {result['versions']} versions: {result['full_bytes'] / 1024 / 1024:.1f} MiB as full copies, "
+            f"{result['stored_bytes'] / 1024 / 1024:.1f} MiB as deltas + {result['snapshots']} snapshots "
+            f"({saved:.1%} saved, saved in {result['build_time']:.1f}s)"
+        )
+        logger.info(
+            f"📖 Rebuild p50 {result['p50'] * 1000:.2f} ms, p99 {result['p99'] * 1000:.2f} ms, "
+            f"max {result['max'] * 1000:.2f} ms (longest chain {result['max_chain']} queries, delta_chain_max {chain_max})"
+        )
+        if result['mismatches']:
+            logger.error(f"❌ {result['mismatches']} rebuilt configs differ from the saved text")
+
+    def run_collection(self, options):
+        results = benchmark_collection(
+            count=options['devices'],
+            lines=options['lines'],
+            latency=options['latency'],
+            workers=options['workers'],
+            failure=options['failure'],
+            failure_rate=options['failure_rate'],
+        )
+        for label, stats in results.items():
+            logger.info(
+                f"🧪 {label}: {stats['devices']} devices in {stats['wall']:.1f}s ({stats['per_second']:.1f}/s), "
+                f"p50 {stats['p50'] * 1000:.0f} ms, p99 {stats['p99'] * 1000:.0f} ms, {stats['failed']} failed"
+            )
+
+    def run_clean(self, options):
+        for key, stats in benchmark_clean(options['size_mb']).items():
+            logger.info(
+                f"🧹 {key}: {stats['bytes'] / 1024 / 1024:.1f} MiB, {stats['lines']} lines "
+                f"in {stats['best'] * 1000:.0f} ms ({stats['mb_per_second']:.0f} MiB/s, median {stats['median'] * 1000:.0f} ms)"
+            )
+
+    def run_capture(self, options):
+        results = benchmark_capture(
+            count=options['devices'],
+            lines=options['lines'],
+            latency=options['latency'],
+            workers=options['workers'],
+        )
+        for name, stats in results.items():
+            logger.info(
+                f"📥 {name}: {stats['devices']} devices in {stats['wall']:.1f}s ({stats['per_second']:.1f}/s), "
+                f"p50 {stats['p50'] * 1000:.0f} ms, p99 {stats['p99'] * 1000:.0f} ms, "
+                f"{stats['failed']} failed, {stats['differs']} differ from {next(iter(results))}"
+            )
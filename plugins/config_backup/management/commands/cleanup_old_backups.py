@@ -1,7 +1,6 @@
-import os
+from collections import Counter
 from django.core.management.base import BaseCommand
-from dcim.models import Device
-from netbox_config_backup.models import ConfigBackup
+from netbox_config_backup.utilities.retention import find_expired_backups, delete_backups, delete_orphan_blobs
 import logging
 
 logger = logging.getLogger(__name__)
@@ -27,33 +26,63 @@ class Command(BaseCommand):
             default=15,
             help='Minimum number of backups before cleanup triggers'
         )
+        parser.add_argument(
+            '--max-age',
+            type=int,
+            help='Also keep every backup younger than this many days'
+        )
+        parser.add_argument(
+            '--daily',
+            type=int,
+            default=0,
+            help='Also keep the newest backup of each of the last N days with backups'
+        )
+        parser.add_argument(
+            '--weekly',
+            type=int,
+            default=0,
+            help='Also keep the newest backup of each of the last N weeks with backups'
+        )
+        parser.add_argument(
+            '--monthly',
+            type=int,
+            default=0,
+            help='Also keep the newest backup of each of the last N months with backups'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Number of backups deleted per transaction'
+        )
 
     def handle(self, *args, **options):
         dry_run = options['dry_run']
         keep_count = options['keep']
-        threshold = options['threshold']
-        total_deleted = 0
-        
-        for device in Device.objects.all():
-            backups = ConfigBackup.objects.filter(device=device).order_by('-created')
-            backup_count = backups.count()
-            
-            if backup_count <= threshold:
-                continue
-                
-            keep_ids = list(backups.values_list('id', flat=True)[:keep_count])  
-            to_delete = backups.exclude(id__in=keep_ids)
-            
-            logger.info(f"Device {device}: {backup_count} backups found, keeping {keep_count}")
-            
+
+        # One windowed query decides everything, for both dry and real runs
+        expired = find_expired_backups(
+            keep=keep_count,
+            threshold=options['threshold'],
+            max_age_days=options['max_age'],
+            daily=options['daily'],
+            weekly=options['weekly'],
+            monthly=options['monthly'],
+        )
+
+        per_device = Counter(device_name for _, _, device_name in expired)
+        for device_name, count in sorted(per_device.items()):
             if dry_run:
-                logger.info(f"DRY RUN: Would delete {to_delete.count()} backups")
-                continue
-                
-            # Actual deletion
-            deleted_count, _ = to_delete.delete()
-            total_deleted += deleted_count
-            logger.info(f"Deleted {deleted_count} backups for {device}")
-
-        logger.info(f"TOTAL DELETED: {total_deleted} backups")
+                logger.info(f"DRY RUN: Device {device_name}: would delete {count} backups")
+            else:
+                logger.info(f"Device {device_name}: deleting {count} backups")
+
+        if dry_run:
+            logger.info(f"DRY RUN: Would delete {len(expired)} backups on {len(per_device)} devices")
+            return f"Dry run complete. Would delete {len(expired)} backups."
+
+        total_deleted = delete_backups([backup_id for backup_id, _, _ in expired], options['batch_size'])
+        blobs_deleted = delete_orphan_blobs(options['batch_size'])
+
+        logger.info(f"TOTAL DELETED: {total_deleted} backups, {blobs_deleted} unreferenced configs")
         return f"Cleanup complete. Deleted {total_deleted} backups."
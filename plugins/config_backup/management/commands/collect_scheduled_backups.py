@@ -1,5 +1,7 @@
 from django.core.management.base import BaseCommand
+from netbox.plugins import get_plugin_config
 from netbox_config_backup.tasks import collect_scheduled_backups
+from netbox_config_backup.utilities.ssh_pool import get_ssh_pool
 from dotenv import load_dotenv
 import logging
 
@@ -10,7 +12,70 @@ logger = logging.getLogger("netbox_config_backup")
 class Command(BaseCommand):
     help = "Collect scheduled config backups for all devices"
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--backend',
+            choices=['local', 'rq'],
+            help='Collect here (local) or enqueue one job per device for the RQ workers (default: collection_backend setting)'
+        )
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Collect every enabled device, not only those due on the adaptive schedule'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            help='Number of devices collected concurrently (default: collection_workers setting)'
+        )
+        parser.add_argument(
+            '--per-site-limit',
+            type=int,
+            help='Maximum concurrent collections per site (default: per_site_limit setting)'
+        )
+        parser.add_argument(
+            '--per-manufacturer-limit',
+            type=int,
+            help='Maximum concurrent collections per manufacturer (default: per_manufacturer_limit setting)'
+        )
+
     def handle(self, *args, **options):
+        backend = options['backend'] or get_plugin_config('netbox_config_backup', 'collection_backend')
+        if backend == 'rq':
+            from netbox_config_backup.jobs import QUEUE_NAME, enqueue_scheduled_backups
+            run = enqueue_scheduled_backups(due_only=not options['all'])
+            logger.info(
+                f"📬 Run {run.pk}: enqueued {run.devices} devices on {QUEUE_NAME}, "
+                f"{run.skipped} skipped (already queued or running)"
+            )
+            return
+
         logger.info("🚀 Scheduled backup job started (cron/management command)")
-        collect_scheduled_backups()
-        logger.info("✅ Scheduled backup job finished")
+        pool = get_ssh_pool()
+        try:
+            summary = collect_scheduled_backups(
+                workers=options['workers'],
+                per_site_limit=options['per_site_limit'],
+                per_manufacturer_limit=options['per_manufacturer_limit'],
+                due_only=not options['all'],
+            )
+        finally:
+            pool.close_all()
+        logger.info(
+            f"✅ Scheduled backup job finished: {summary['devices']} devices, "
+            f"{summary['saved']} saved, {summary['unchanged']} unchanged, {summary['failed']} failed"
+        )
+        wall_time = summary['wall_time']
+        device_time = summary['device_time']
+        speedup = device_time / wall_time if wall_time else 0
+        logger.info(f"⏱ Wall-clock {wall_time:.1f}s, cumulative device time {device_time:.1f}s ({speedup:.1f}x)")
+        phases = summary['timings'].phases
+        logger.info("⏱ Phases: " + ", ".join(
+            f"{name} {phases[name].sum:.1f}s (avg {phases[name].sum / phases[name].count:.2f}s)"
+            for name in phases if phases[name].count
+        ) + f", {summary['timings'].bytes.sum / 1024 / 1024:.1f} MiB received")
+        stats = summary['pool']
+        logger.info(
+            f"🔌 SSH sessions: {stats.get('connects', 0)} connects in {stats.get('connect_seconds', 0):.1f}s, "
+            f"{stats.get('reuses', 0)} reused, {stats.get('connect_failures', 0)} failed"
+        )
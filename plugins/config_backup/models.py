@@ -1,7 +1,167 @@
-from django.db import models
+import hashlib
+from django.db import models, transaction
+from django.db.models import Q
+from django.contrib.postgres.indexes import GinIndex
+from django.db.models.query_utils import DeferredAttribute
 from netbox.models import ChangeLoggedModel
 from dcim.models import Device
 from django.utils.timezone import now
+from datetime import timedelta
+from netbox.plugins import get_plugin_config
+from .utilities.archive import read_archived
+from .utilities.delta import make_delta, apply_delta, delta_size
+from .utilities.diff_utils import line_changes
+from .utilities.scheduler import get_schedule_settings, next_schedule, get_next_due
+from .utilities.metrics import RunTimings
+
+
+def config_digest(text):
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+class ILike(models.Lookup):
+    """
+    Case-insensitive substring match written as ILIKE. icontains compiles to
+    UPPER(text) LIKE, which the trigram index on the plain column can't serve;
+    ILIKE and ~* (iregex) can, so one index covers both kinds of search.
+    """
+    lookup_name = 'ilike'
+
+    def get_db_prep_lookup(self, value, connection):
+        return '%s', ['%' + connection.ops.prep_for_like_query(value) + '%']
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f'{lhs} ILIKE {rhs}', [*lhs_params, *rhs_params]
+
+
+class ConfigBlob(models.Model):
+    """Config text stored once per distinct content, keyed by its SHA-256 digest"""
+    digest = models.CharField(max_length=64, unique=True)
+    # Empty once the blob has been moved to a pack file (archive_old_backups) or stored as a delta
+    text = models.TextField(blank=True)
+    archive_locator = models.CharField(max_length=100, blank=True)
+    # storage_mode 'delta': older versions are rebuilt from the next newer one
+    delta_base = models.ForeignKey(
+        to='self',
+        on_delete=models.PROTECT,
+        related_name='delta_children',
+        blank=True,
+        null=True
+    )
+    delta = models.JSONField(blank=True, null=True)
+    # Deltas chained in front of this blob; a full snapshot is kept once it reaches delta_chain_max
+    delta_run = models.PositiveIntegerField(default=0)
+    size = models.PositiveIntegerField(default=0)
+    created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # Fleet-wide config search (needs the pg_trgm extension), queried with text__ilike / text__iregex
+            GinIndex(fields=['text'], name='configblob_text_trgm', opclasses=['gin_trgm_ops']),
+        ]
+        verbose_name = 'Config Blob'
+        verbose_name_plural = 'Config Blobs'
+
+    def __str__(self):
+        return self.digest
+
+    @property
+    def is_archived(self):
+        return bool(self.archive_locator)
+
+    def get_text(self):
+        if self.delta_base_id:
+            return apply_delta(self.delta_base.get_text(), self.delta)
+        if self.archive_locator:
+            return read_archived(self.archive_locator)
+        return self.text
+
+    def store_as_delta(self, base):
+        """
+        Replace the full text with a reverse delta against the newer base.
+        Keeps the text when a snapshot is due or the delta would not be smaller.
+        """
+        if self.delta_base_id or self.archive_locator or base.delta_base_id or base.pk == self.pk:
+            return False
+        if self.delta_run + 1 >= get_plugin_config('netbox_config_backup', 'delta_chain_max'):
+            return False
+        ops = make_delta(base.get_text(), self.text)
+        if delta_size(ops) >= len(self.text):
+            return False
+        self.delta = ops
+        self.delta_base = base
+        self.text = ''
+        self.save(update_fields=['delta', 'delta_base', 'text'])
+        if base.delta_run < self.delta_run + 1:
+            base.delta_run = self.delta_run + 1
+            base.save(update_fields=['delta_run'])
+        return True
+
+    @classmethod
+    def intern(cls, text):
+        """
+        The blob for text, restored to full text if it was archived or a delta. An existing
+        row stays locked until the caller's transaction ends (ConfigBackup.save() holds it until
+        the new latest pointer is stored), so archive_old_backups can't archive it meanwhile.
+        """
+        with transaction.atomic(savepoint=False):
+            blob, created = cls.objects.select_for_update().get_or_create(
+                digest=config_digest(text),
+                defaults={'text': text, 'size': len(text)}
+            )
+            if not created and (blob.archive_locator or blob.delta_base_id):
+                # A device went back to an archived or delta-stored config: the latest backup
+                # is always kept in full. The pack record stays behind as dead space.
+                blob.text = text
+                blob.archive_locator = ''
+                blob.delta = None
+                blob.delta_base = None
+                blob.save(update_fields=['text', 'archive_locator', 'delta', 'delta_base'])
+        return blob
+
+
+ConfigBlob._meta.get_field('text').register_lookup(ILike)
+
+
+class ConfigTextDescriptor(DeferredAttribute):
+    """Returns the inline text, or the blob text (from its pack file if archived) once moved to the blob store"""
+
+    def __get__(self, instance, cls=None):
+        if instance is None:
+            return self
+        if self.field.attname not in instance.__dict__ and instance.blob_id:
+            # Deferred, and the column is empty once the text is in a blob: skip loading it
+            return instance.blob.get_text()
+        text = super().__get__(instance, cls)
+        if not text and instance.blob_id:
+            return instance.blob.get_text()
+        return text
+
+    def __set__(self, instance, value):
+        instance.__dict__[self.field.attname] = value
+
+
+class ConfigTextField(models.TextField):
+    """
+    TextField whose column only holds text that has not been moved to a
+    ConfigBlob yet. Reading the attribute transparently falls back to the blob.
+    """
+    descriptor_class = ConfigTextDescriptor
+
+    def pre_save(self, model_instance, add):
+        return model_instance.__dict__.get(self.attname, '')
+
+    def value_from_object(self, obj):
+        # Serialize what the row actually holds (e.g. for change logging), not the blob text
+        return obj.__dict__.get(self.attname, '')
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        # Same column as before, no schema change
+        return name, 'django.db.models.TextField', args, kwargs
+
 
 class ConfigBackup(ChangeLoggedModel):
     device = models.ForeignKey(
@@ -9,7 +169,19 @@ class ConfigBackup(ChangeLoggedModel):
         on_delete=models.CASCADE,
         related_name='config_backups'
     )
-    config = models.TextField(blank=True)
+    config = ConfigTextField(blank=True)
+    blob = models.ForeignKey(
+        to=ConfigBlob,
+        on_delete=models.PROTECT,
+        related_name='backups',
+        blank=True,
+        null=True
+    )
+    config_hash = models.CharField(max_length=64, blank=True, db_index=True)
+    # Precomputed for the history table, so listing never reads the config text
+    config_size = models.PositiveIntegerField(default=0)
+    lines_added = models.PositiveIntegerField(blank=True, null=True)
+    lines_removed = models.PositiveIntegerField(blank=True, null=True)
     created = models.DateTimeField(auto_now_add=True)
     last_checked = models.DateTimeField(auto_now_add=True)
     last_status = models.CharField(max_length=255)
@@ -23,8 +195,390 @@ class ConfigBackup(ChangeLoggedModel):
 
     class Meta:
         ordering = ['-created']
+        indexes = [
+            models.Index(fields=['device', '-created'], name='configbackup_device_created'),
+            # Keyset pagination of the API list across all devices
+            models.Index(fields=['-created'], name='configbackup_created'),
+        ]
         verbose_name = 'Config Backup'
         verbose_name_plural = 'Config Backups'
 
     def get_absolute_url(self):
         return self.device.get_absolute_url()
+
+    def save(self, *args, **kwargs):
+        # The blob stays locked until the latest pointer is stored, see ConfigBlob.intern()
+        with transaction.atomic(savepoint=False):
+            self._save(*args, **kwargs)
+
+    def _save(self, *args, **kwargs):
+        # Move freshly assigned text into the blob store, the row keeps only the reference
+        text = self.__dict__.get('config')
+        if text:
+            self.blob = ConfigBlob.intern(text)
+            self.config_hash = self.blob.digest
+            self.config_size = self.blob.size
+            self.config = ''
+        adding = self._state.adding
+        super().save(*args, **kwargs)
+        if adding:
+            if self.blob_id and get_plugin_config('netbox_config_backup', 'storage_mode') == 'delta':
+                previous = DeviceBackupState.get_latest(self.device_id)
+                if previous is not None and previous.pk == self.pk:
+                    # No pointer yet, the fallback found this row: the previous one is the next newest
+                    previous = ConfigBackup.objects.filter(device_id=self.device_id).exclude(pk=self.pk).order_by(
+                        '-created', '-pk'
+                    ).first()
+                shared = previous and DeviceBackupState.objects.filter(
+                    latest__blob_id=previous.blob_id
+                ).exclude(device_id=self.device_id).exists()
+                # Another device's latest backup must stay in full (search, diffs)
+                if previous and previous.blob_id and not shared:
+                    previous.blob.store_as_delta(self.blob)
+            # A new row is always the newest one for its device
+            DeviceBackupState.set_latest(self)
+
+    @classmethod
+    def fill_line_changes(cls, backups):
+        """
+        Lines added/removed against the previous config, for the backups that don't have
+        them yet. backups are one device's rows newest first, as on the history page; called
+        for the rows being displayed, not from save(), so collecting never diffs. The counts
+        are stored, each version is diffed once.
+        """
+        missing = [backup for backup in backups if backup.lines_added is None and backup.blob_id]
+        if not missing:
+            return
+        with_config = [backup for backup in backups if backup.blob_id]
+        # The previous config of a row is the next row down; only the oldest one needs a query
+        previous = {newer.pk: older.blob_id for newer, older in zip(with_config, with_config[1:])}
+        oldest = with_config[-1]
+        if oldest.lines_added is None:
+            previous[oldest.pk] = cls.objects.filter(
+                device_id=oldest.device_id, blob__isnull=False, created__lt=oldest.created
+            ).order_by('-created', '-pk').values_list('blob_id', flat=True).first()
+
+        pairs = [(backup, previous[backup.pk]) for backup in missing if previous[backup.pk]]
+        needed = {blob_id for backup, previous_id in pairs if previous_id != backup.blob_id
+                  for blob_id in (previous_id, backup.blob_id)}
+        blobs = ConfigBlob.objects.in_bulk(needed)
+        texts = {}
+
+        def get_text(blob_id):
+            if blob_id not in texts:
+                texts[blob_id] = blobs[blob_id].get_text()
+            return texts[blob_id]
+
+        for backup, previous_id in pairs:
+            if previous_id == backup.blob_id:
+                backup.lines_added = backup.lines_removed = 0
+            else:
+                backup.lines_added, backup.lines_removed = line_changes(get_text(previous_id), get_text(backup.blob_id))
+        cls.objects.bulk_update([backup for backup, _ in pairs], ['lines_added', 'lines_removed'])
+
+
+class DeviceBackupState(models.Model):
+    """Per-device pointer to the newest backup, so "latest" lookups are a single indexed read"""
+    device = models.OneToOneField(
+        to=Device,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='backup_state'
+    )
+    latest = models.ForeignKey(
+        to=ConfigBackup,
+        on_delete=models.SET_NULL,
+        related_name='+',
+        blank=True,
+        null=True
+    )
+    # Adaptive AUTO schedule: empty next_due means due now
+    next_due = models.DateTimeField(blank=True, null=True, db_index=True)
+    interval = models.PositiveIntegerField(blank=True, null=True, help_text='Seconds between collections')
+    failures = models.PositiveSmallIntegerField(default=0)
+    # CollectionStats of the last scheduled collection
+    last_timings = models.JSONField(default=dict, blank=True)
+    # Capture strategy that last worked, tried first next time
+    capture_strategy = models.CharField(max_length=20, blank=True)
+
+    class Meta:
+        verbose_name = 'Device Backup State'
+        verbose_name_plural = 'Device Backup States'
+
+    def __str__(self):
+        return str(self.device)
+
+    @classmethod
+    def get_latest(cls, device_id):
+        state = cls.objects.select_related('latest').filter(device_id=device_id).first()
+        if state is not None:
+            return state.latest
+        # No pointer yet (backups older than the pointer table): find the newest row and keep it
+        latest = ConfigBackup.objects.filter(device_id=device_id).order_by('-created', '-pk').first()
+        if latest is not None:
+            cls.set_latest(latest)
+        return latest
+
+    @classmethod
+    def set_latest(cls, backup):
+        cls.objects.bulk_create(
+            [cls(device_id=backup.device_id, latest=backup)],
+            update_conflicts=True,
+            unique_fields=['device'],
+            update_fields=['latest'],
+        )
+
+    @classmethod
+    def claim(cls, statuses, due_only=True):
+        """
+        Device ids whose latest backup has one of the statuses (and that are due), with
+        next_due pushed past schedule_claim_timeout in the same transaction. Rows another
+        run is claiming right now are skipped, so overlapping runs never share a device.
+        """
+        states = cls.objects.select_for_update(skip_locked=True, of=('self',)).filter(
+            latest__status__in=statuses,
+            device__status='active',
+        ).filter(
+            Q(device__primary_ip4__isnull=False) | Q(device__primary_ip6__isnull=False) | Q(device__oob_ip__isnull=False)
+        )
+        if due_only:
+            states = states.filter(Q(next_due__isnull=True) | Q(next_due__lte=now()))
+        claim_timeout = get_plugin_config('netbox_config_backup', 'schedule_claim_timeout')
+        with transaction.atomic():
+            device_ids = list(states.values_list('device_id', flat=True))
+            cls.objects.filter(device_id__in=device_ids).update(next_due=get_next_due(now(), claim_timeout))
+        return device_ids
+
+    @classmethod
+    def lock_if_status(cls, device_id, statuses):
+        """Whether the device's latest backup has one of the statuses; its pointer row stays locked until the transaction ends"""
+        return cls.objects.select_for_update(of=('self',)).filter(
+            device_id=device_id, latest__status__in=statuses
+        ).values_list('pk', flat=True).first() is not None
+
+    @classmethod
+    def schedule(cls, device_id, outcome, stats=None, statuses=None, current=None):
+        """
+        Set the next due time after a collection with outcome 'saved', 'unchanged' or 'failed'.
+        With statuses, only while the latest backup still has one of them; None if nothing was updated.
+        current: (interval, failures) if already loaded, saves reading them again.
+        """
+        if current is None:
+            current = cls.objects.filter(device_id=device_id).values_list('interval', 'failures').first()
+        if current is None:
+            return None
+        interval, failures, delay = next_schedule(outcome, current[0], current[1], get_schedule_settings())
+        next_due = get_next_due(now(), delay)
+        changes = {
+            'interval': interval,
+            'failures': failures,
+            'next_due': next_due,
+            'last_timings': stats.as_dict() if stats is not None else {},
+        }
+        if stats is not None and stats.strategy:
+            changes['capture_strategy'] = stats.strategy
+        states = cls.objects.filter(device_id=device_id)
+        if statuses is not None:
+            states = states.filter(latest__status__in=statuses)
+        return next_due if states.update(**changes) else None
+
+    @classmethod
+    def fill_missing(cls):
+        """Pointers for devices that have backups but no row yet (after migrate, see signals). Returns the count"""
+        device_ids = list(
+            ConfigBackup.objects.filter(device__backup_state__isnull=True).values_list('device_id', flat=True).distinct()
+        )
+        return cls.refresh(device_ids) if device_ids else 0
+
+    @classmethod
+    def refresh(cls, device_ids=None):
+        """Recompute the pointer from ConfigBackup, for the given devices or the whole fleet"""
+        backups = ConfigBackup.objects.all()
+        if device_ids is not None:
+            backups = backups.filter(device_id__in=device_ids)
+        latest = dict(
+            backups.order_by('device_id', '-created').distinct('device_id').values_list('device_id', 'pk')
+        )
+        cls.objects.bulk_create(
+            [cls(device_id=device_id, latest_id=backup_id) for device_id, backup_id in latest.items()],
+            update_conflicts=True,
+            unique_fields=['device'],
+            update_fields=['latest'],
+            batch_size=1000,
+        )
+        # Devices whose last backup is gone were nulled by SET_NULL
+        stale = cls.objects.filter(latest__isnull=True)
+        if device_ids is not None:
+            stale = stale.filter(device_id__in=device_ids)
+        stale.delete()
+        return len(latest)
+
+
+class CollectionRun(models.Model):
+    """One collection pass; counters are filled in as device collections finish"""
+    SOURCE_CHOICES = [
+        ('schedule', 'Scheduled'),
+        ('api', 'API'),
+    ]
+
+    created = models.DateTimeField(auto_now_add=True)
+    finished = models.DateTimeField(blank=True, null=True)
+    backend = models.CharField(
+        max_length=10,
+        choices=[('local', 'Local'), ('rq', 'RQ')],
+        default='local'
+    )
+    source = models.CharField(max_length=10, choices=SOURCE_CHOICES, default='schedule')
+    devices = models.PositiveIntegerField(default=0)
+    # Devices left out because a collection job for them was still queued or running
+    skipped = models.PositiveIntegerField(default=0)
+    saved = models.PositiveIntegerField(default=0)
+    unchanged = models.PositiveIntegerField(default=0)
+    failed = models.PositiveIntegerField(default=0)
+    # RunTimings histograms: per-phase seconds and bytes received per device
+    timings = models.JSONField(default=dict, blank=True)
+
+    class Meta:
+        ordering = ['-created']
+        verbose_name = 'Collection Run'
+        verbose_name_plural = 'Collection Runs'
+
+    def __str__(self):
+        return f"{self.get_backend_display()} run {self.created:%Y-%m-%d %H:%M}"
+
+    @property
+    def completed(self):
+        return self.saved + self.unchanged + self.failed
+
+    @classmethod
+    def record(cls, run_id, outcome, stats=None, pool=None):
+        """
+        Count one device outcome ('saved', 'unchanged' or 'failed'); safe from concurrent workers.
+        'skipped' (disabled while queued) moves the device to skipped, like the ones skipped at enqueue time.
+        pool: SSH pool counters of the collection, added to CollectionTotals.
+        """
+        with transaction.atomic():
+            run = cls.objects.select_for_update().filter(pk=run_id).first()
+            if run is None:
+                return
+            if outcome == 'skipped':
+                run.devices -= 1
+                run.skipped += 1
+                run.save(update_fields=['devices', 'skipped'])
+            else:
+                setattr(run, outcome, getattr(run, outcome) + 1)
+                device_timings = RunTimings()
+                if stats is not None:
+                    device_timings.record(stats)
+                    timings = RunTimings(run.timings)
+                    timings.merge(device_timings)
+                    run.timings = timings.as_dict()
+                run.save(update_fields=[outcome, 'timings'])
+                CollectionTotals.add(run.source, {outcome: 1}, device_timings, pool)
+        cls.close_if_complete(run_id)
+
+    @classmethod
+    def record_pool(cls, run_id, pool):
+        """SSH pool counters of an attempt that is retried, its outcome is counted by the last one"""
+        source = cls.objects.filter(pk=run_id).values_list('source', flat=True).first()
+        if source and pool:
+            CollectionTotals.add(source, {}, pool=pool)
+
+    @classmethod
+    def prune(cls):
+        """Delete runs (and their results) older than collection_run_retention_days; CollectionTotals keeps the counts"""
+        days = get_plugin_config('netbox_config_backup', 'collection_run_retention_days')
+        if not days:
+            return 0
+        deleted, _ = cls.objects.filter(created__lt=now() - timedelta(days=days)).delete()
+        return deleted
+
+    @classmethod
+    def close_if_complete(cls, run_id):
+        # Whichever worker finishes the last device closes the run
+        cls.objects.filter(
+            pk=run_id,
+            finished__isnull=True,
+            devices__lte=models.F('saved') + models.F('unchanged') + models.F('failed'),
+        ).update(finished=now())
+
+
+class CollectionTotals(models.Model):
+    """
+    Outcomes and timings of every device collection per run source, for the
+    metrics endpoint. Only ever added to, so the counters survive CollectionRun.prune().
+    """
+    source = models.CharField(max_length=10, choices=CollectionRun.SOURCE_CHOICES, unique=True)
+    saved = models.PositiveBigIntegerField(default=0)
+    unchanged = models.PositiveBigIntegerField(default=0)
+    failed = models.PositiveBigIntegerField(default=0)
+    timings = models.JSONField(default=dict, blank=True)
+    # SSH session pool counters (utilities.ssh_pool.POOL_COUNTERS) of the collections
+    pool = models.JSONField(default=dict, blank=True)
+
+    class Meta:
+        ordering = ['source']
+        verbose_name = 'Collection Totals'
+        verbose_name_plural = 'Collection Totals'
+
+    def __str__(self):
+        return self.get_source_display()
+
+    @classmethod
+    def add(cls, source, outcomes, timings=None, pool=None):
+        """Add {outcome: count}, a RunTimings and pool counters to the source's row; safe from concurrent workers"""
+        with transaction.atomic():
+            cls.objects.bulk_create([cls(source=source)], ignore_conflicts=True)
+            totals = cls.objects.select_for_update().get(source=source)
+            for outcome, count in outcomes.items():
+                setattr(totals, outcome, getattr(totals, outcome) + count)
+            if timings is not None:
+                merged = RunTimings(totals.timings)
+                merged.merge(timings)
+                totals.timings = merged.as_dict()
+            for name, value in (pool or {}).items():
+                totals.pool[name] = totals.pool.get(name, 0) + value
+            totals.save()
+
+
+class CollectionResult(models.Model):
+    """Progress and outcome of one device in a CollectionRun started through the API"""
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('saved', 'Saved'),
+        ('unchanged', 'Unchanged'),
+        ('failed', 'Failed'),
+        ('skipped', 'Skipped'),
+    ]
+
+    run = models.ForeignKey(
+        to=CollectionRun,
+        on_delete=models.CASCADE,
+        related_name='results'
+    )
+    device = models.ForeignKey(
+        to=Device,
+        on_delete=models.CASCADE,
+        related_name='+'
+    )
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    message = models.CharField(max_length=255, blank=True)
+    # Latest backup of the device once collected (the new one if saved, the matching one if unchanged)
+    backup = models.ForeignKey(
+        to=ConfigBackup,
+        on_delete=models.SET_NULL,
+        related_name='+',
+        blank=True,
+        null=True
+    )
+    started = models.DateTimeField(blank=True, null=True)
+    finished = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        ordering = ['pk']
+        constraints = [
+            models.UniqueConstraint(fields=['run', 'device'], name='collectionresult_run_device'),
+        ]
+        verbose_name = 'Collection Result'
+        verbose_name_plural = 'Collection Results'
@@ -0,0 +1,8 @@
+from netbox.plugins import PluginMenuItem
+
+menu_items = (
+    PluginMenuItem(
+        link='plugins:netbox_config_backup:config_search',
+        link_text='Config Search',
+    ),
+)
@@ -8,4 +8,10 @@ setup(
     install_requires=[
         'paramiko>=2.7.1',
     ],
+    extras_require={
+        # Archive compression, zlib otherwise
+        'zstd': ['zstandard'],
+        # rq_fake_redis and the RQ job tests
+        'test': ['fakeredis'],
+    },
 )
@@ -1,41 +1,74 @@
+from django.db import transaction
 from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
+import threading
 import logging
 
 logger = logging.getLogger(__name__)
 
-@receiver(post_save)
-@receiver(post_delete)
-def update_device_backup_status(sender, **kwargs):
-    # Only handle ConfigBackup model
-    if sender.__name__ != 'ConfigBackup':
+# Devices touched in the current thread, flushed once per transaction
+_pending = threading.local()
+
+
+def get_backup_status(latest_status):
+    # Default status changed to "Disabled" instead of "No Backups"
+    if latest_status == "Backup Enabled":
+        return "Auto Enabled"
+    if latest_status == "Backup Disabled":
+        return "Disabled"  # Explicitly keep as Disabled
+    if latest_status == "Collected":
+        return "Manual"
+    return "Disabled"
+
+
+def flush_backup_status():
+    devices = getattr(_pending, 'devices', None)
+    if not devices:
         return
-        
+    _pending.devices = {}
+
     try:
         from dcim.models import Device
-        from .models import ConfigBackup
-        
-        instance = kwargs.get('instance')
-        if not instance:
-            return
-            
-        device = instance.device
-        latest_backup = ConfigBackup.objects.filter(device=device).order_by('-created').first()
-        
-        # Default status changed to "Disabled" instead of "No Backups"
-        status = "Disabled"
-        if latest_backup:
-            if latest_backup.status == "Backup Enabled":
-                status = "Auto Enabled"
-            elif latest_backup.status == "Backup Disabled":
-                status = "Disabled"  # Explicitly keep as Disabled
-            elif latest_backup.status == "Collected":
-                status = "Manual"
-        
-        if device.custom_field_data.get('backup_status') != status:
-            device.custom_field_data['backup_status'] = status
-            device.save()
-            logger.debug(f"Updated backup_status for device {device} to {status}")
-            
+        from .models import DeviceBackupState
+
+        deleted = [device_id for device_id, was_deleted in devices.items() if was_deleted]
+        if deleted:
+            # A deleted backup may have been the latest one
+            DeviceBackupState.refresh(deleted)
+
+        latest_status = dict(
+            DeviceBackupState.objects.filter(device_id__in=list(devices)).values_list('device_id', 'latest__status')
+        )
+        for device_id, custom_field_data in Device.objects.filter(pk__in=list(devices)).values_list('pk', 'custom_field_data'):
+            status = get_backup_status(latest_status.get(device_id))
+            if custom_field_data.get('backup_status') != status:
+                custom_field_data['backup_status'] = status
+                # Targeted update: no Device.save(), change logging or further signals
+                Device.objects.filter(pk=device_id).update(custom_field_data=custom_field_data)
+                logger.debug(f"Updated backup_status for device {device_id} to {status}")
+
     except Exception as e:
         logger.error(f"Error updating backup status: {str(e)}")
+
+
+@receiver(post_save, sender='netbox_config_backup.ConfigBackup')
+@receiver(post_delete, sender='netbox_config_backup.ConfigBackup')
+def update_device_backup_status(sender, instance, **kwargs):
+    devices = getattr(_pending, 'devices', None)
+    if devices is None:
+        devices = _pending.devices = {}
+    # post_delete has no 'created' kwarg
+    devices[instance.device_id] = devices.get(instance.device_id, False) or 'created' not in kwargs
+    # Every callback flushes everything pending, later ones in the same transaction are no-ops
+    transaction.on_commit(flush_backup_status)
+
+
+def fill_latest_pointers(sender, **kwargs):
+    """
+    post_migrate: backups saved before the pointer table existed get their pointer, so
+    scheduling, search and "latest" work right after makemigrations + migrate
+    """
+    from .models import DeviceBackupState
+    filled = DeviceBackupState.fill_missing()
+    if filled:
+        logger.info(f"📌 Filled latest-backup pointers for {filled} devices")
@@ -1,26 +1,135 @@
 from dcim.models import Device
-from .models import ConfigBackup
+from netbox.plugins import get_plugin_config
+from .models import CollectionRun, CollectionTotals, ConfigBackup, DeviceBackupState, config_digest
 from .utilities.backup_utils import backup_device_config
+from .utilities.metrics import CollectionStats, RunTimings
+from .utilities.ssh_pool import get_ssh_pool
+from django.db import transaction
 from django.utils.timezone import now
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from collections import Counter
 import os
+import time
 import logging
 
 logger = logging.getLogger("netbox_config_backup")
 
-def collect_scheduled_backups():
-    for device in Device.objects.filter(status='active'):
+PLUGIN_NAME = 'netbox_config_backup'
+
+# Latest backup statuses that keep a device in the scheduled collection
+SCHEDULED_STATUSES = ['Backup Enabled', 'Collected']
+
+
+def get_backup_credentials():
+    return os.getenv("DEVICE_BACKUP_USER"), os.getenv("DEVICE_BACKUP_PASSWORD")
+
+
+def collect_in_parallel(devices, collect, on_result, workers=1, per_site_limit=None, per_manufacturer_limit=None):
+    """
+    Run collect(device) for every device on a bounded thread pool.
+
+    Workers only talk SSH. Every on_result(device, result, elapsed) call happens
+    in the calling thread, so all ORM writes stay in a single writer.
+    Returns (wall_time, cumulative_device_time) in seconds.
+    """
+    workers = max(1, workers or 1)
+    pending = list(devices)
+    in_flight = {}
+    site_load = Counter()
+    manufacturer_load = Counter()
+
+    def site_key(device):
+        return device.site_id
+
+    def manufacturer_key(device):
+        return device.device_type.manufacturer_id
+
+    def next_ready():
+        for index, device in enumerate(pending):
+            if per_site_limit and site_load[site_key(device)] >= per_site_limit:
+                continue
+            if per_manufacturer_limit and manufacturer_load[manufacturer_key(device)] >= per_manufacturer_limit:
+                continue
+            return pending.pop(index)
+        return None
+
+    def timed(device):
+        started = time.monotonic()
+        result = collect(device)
+        return result, time.monotonic() - started
+
+    cumulative = 0.0
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='config-backup') as executor:
+        while pending or in_flight:
+            while len(in_flight) < workers:
+                device = next_ready()
+                if device is None:
+                    break
+                site_load[site_key(device)] += 1
+                manufacturer_load[manufacturer_key(device)] += 1
+                in_flight[executor.submit(timed, device)] = device
+
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                device = in_flight.pop(future)
+                site_load[site_key(device)] -= 1
+                manufacturer_load[manufacturer_key(device)] -= 1
+                try:
+                    result, elapsed = future.result()
+                except Exception as e:
+                    result, elapsed = (None, f"Collection failed: {str(e)}"), 0.0
+                cumulative += elapsed
+                on_result(device, result, elapsed)
+
+    return time.monotonic() - started, cumulative
+
+
+def get_scheduled_devices(due_only=True):
+    """
+    Devices due for an AUTO collection, with everything the SSH code touches
+    preloaded, and {device_id: (latest hash, latest status)}.
+    due_only=False ignores the adaptive schedule and returns every enabled device.
+    The devices are claimed (DeviceBackupState.claim), a run started meanwhile won't get them.
+    """
+    devices = Device.objects.filter(
+        pk__in=DeviceBackupState.claim(SCHEDULED_STATUSES, due_only)
+    ).select_related(
+        'primary_ip4', 'primary_ip6', 'oob_ip', 'device_type__manufacturer', 'backup_state'
+    )
+
+    # (device_id -> latest hash, status) for the whole fleet in one query, no config text
+    latest_backups = {
+        device_id: (config_hash, status)
+        for device_id, config_hash, status in DeviceBackupState.objects.filter(
+            latest__isnull=False
+        ).values_list('device_id', 'latest__config_hash', 'latest__status')
+    }
+
+    scheduled = []
+    for device in devices:
         ip = device.primary_ip or device.oob_ip
         if not ip:
             continue  # Don't log devices with no IP (per your request)
-        latest = ConfigBackup.objects.filter(device=device).order_by('-created').first()
+        latest = latest_backups.get(device.pk)
         # Only run for devices where latest status is "Backup Enabled" or "Collected"
-        if not latest or latest.status not in ['Backup Enabled', 'Collected']:
+        if not latest or latest[1] not in SCHEDULED_STATUSES:
             continue  # Skip
-        username = os.getenv("DEVICE_BACKUP_USER")
-        password = os.getenv("DEVICE_BACKUP_PASSWORD")
-        config, status = backup_device_config(device, username, password)
-        last_backup = latest
-        if not last_backup or (config and config != last_backup.config):
+        scheduled.append(device)
+    return scheduled, latest_backups
+
+
+def store_scheduled_result(device, config, status, last_hash, elapsed=0.0, stats=None):
+    """
+    Save an AUTO backup if the config changed and schedule the device's next
+    collection. Returns 'saved', 'unchanged' or 'failed', or 'skipped' when the
+    device's AUTO backup was turned off during the collection: nothing is stored then.
+    """
+    if config and config_digest(config) != last_hash:
+        with transaction.atomic():
+            # A Disable committed meanwhile is seen here, a later one waits for this transaction
+            if not DeviceBackupState.lock_if_status(device.pk, SCHEDULED_STATUSES):
+                return _skipped(device)
             ConfigBackup.objects.create(
                 device=device,
                 config=config or '',
@@ -29,7 +138,122 @@ def collect_scheduled_backups():
                 last_checked=now(),
                 collection_mode='AUTO'
             )
-            logger.info(f"✅ {device.name}: Backup saved (AUTO)")
-        elif status != "Success":
-            logger.error(f"❌ {device.name}: Backup error: {status}")
+            DeviceBackupState.schedule(device.pk, 'saved', stats, current=_loaded_schedule(device))
+        logger.info(f"✅ {device.name}: Backup saved (AUTO) in {elapsed:.1f}s")
+        return 'saved'
+    if status != "Success":
+        logger.error(f"❌ {device.name}: Backup error: {status}")
+        outcome = 'failed'
+    else:
         # No log if config is the same and success
+        outcome = 'unchanged'
+    # Matches nothing if the device was disabled meanwhile
+    if DeviceBackupState.schedule(
+        device.pk, outcome, stats, statuses=SCHEDULED_STATUSES, current=_loaded_schedule(device)
+    ) is None:
+        return _skipped(device)
+    return outcome
+
+
+def _loaded_schedule(device):
+    # Preloaded with select_related('backup_state') by get_scheduled_devices and the RQ job, one
+    # UPDATE per device is then all scheduling costs; a missing state raises AttributeError
+    state = getattr(device, 'backup_state', None)
+    return (state.interval, state.failures) if state is not None else None
+
+
+def _skipped(device):
+    logger.info(f"⏭️ {device.name}: AUTO backup turned off during the collection, nothing stored")
+    return 'skipped'
+
+
+def store_requested_result(device, config, status, last_hash):
+    """
+    Result of a bulk collection requested through the API: a MANUAL 'Collected'
+    row if the config changed. Never an AUTO row, so it doesn't turn scheduled
+    backups on. Returns 'saved', 'unchanged' or 'failed'.
+    """
+    if config and config_digest(config) != last_hash:
+        store_manual_result(device, config, status)
+        logger.info(f"✅ {device.name}: Backup saved (API)")
+        return 'saved'
+    if status != "Success":
+        logger.error(f"❌ {device.name}: Backup error: {status}")
+        return 'failed'
+    return 'unchanged'
+
+
+def store_manual_result(device, config, status, collection_mode='MANUAL'):
+    """
+    Row for a collection started from the UI: always a new one, even if the
+    config didn't change. 'AUTO' is the first collection of "Collect Auto".
+    """
+    if collection_mode == 'AUTO':
+        backup_status = 'Backup Enabled'
+    else:
+        backup_status = 'Collected' if config else f"Failed: {status}"
+    return ConfigBackup.objects.create(
+        device=device,
+        config=config or '',
+        last_status=status,
+        status=backup_status,
+        last_checked=now(),
+        collection_mode=collection_mode
+    )
+
+
+def collect_scheduled_backups(workers=None, per_site_limit=None, per_manufacturer_limit=None, due_only=True):
+    if workers is None:
+        workers = get_plugin_config(PLUGIN_NAME, 'collection_workers')
+    if per_site_limit is None:
+        per_site_limit = get_plugin_config(PLUGIN_NAME, 'per_site_limit')
+    if per_manufacturer_limit is None:
+        per_manufacturer_limit = get_plugin_config(PLUGIN_NAME, 'per_manufacturer_limit')
+
+    CollectionRun.prune()
+    # Load everything the SSH workers touch up front, they must not hit the ORM
+    scheduled, latest_backups = get_scheduled_devices(due_only)
+
+    username, password = get_backup_credentials()
+    summary = Counter(devices=len(scheduled))
+    run = CollectionRun.objects.create(backend='local', devices=len(scheduled))
+
+    timings = RunTimings()
+    pool = get_ssh_pool()
+    pool_before = pool.counters()
+
+    def collect(device):
+        stats = CollectionStats()
+        config, status = backup_device_config(device, username, password, stats)
+        return config, status, stats
+
+    def save_result(device, result, elapsed):
+        # A collection that raised comes back as (None, error) without stats
+        config, status, stats = result if len(result) == 3 else (*result, None)
+        outcome = store_scheduled_result(device, config, status, latest_backups[device.pk][0], elapsed, stats)
+        if stats is not None:
+            timings.record(stats)
+        summary[outcome] += 1
+
+    wall_time, device_time = collect_in_parallel(
+        scheduled,
+        collect,
+        save_result,
+        workers=workers,
+        per_site_limit=per_site_limit,
+        per_manufacturer_limit=per_manufacturer_limit,
+    )
+    CollectionRun.objects.filter(pk=run.pk).update(
+        devices=len(scheduled) - summary['skipped'], skipped=summary['skipped'],
+        saved=summary['saved'], unchanged=summary['unchanged'], failed=summary['failed'],
+        timings=timings.as_dict(), finished=now()
+    )
+    summary['pool'] = pool.counters_since(pool_before)
+    CollectionTotals.add(
+        'schedule', {outcome: summary[outcome] for outcome in ('saved', 'unchanged', 'failed')}, timings, summary['pool']
+    )
+    summary['run_id'] = run.pk
+    summary['timings'] = timings
+    summary['wall_time'] = wall_time
+    summary['device_time'] = device_time
+    return summary
@@ -0,0 +1,124 @@
+import copy
+import os
+from django.test import SimpleTestCase
+from netbox_config_backup.utilities.capture import capture_config, read_until_prompt
+from netbox_config_backup.utilities.device_farm import FARM_PASSWORD, FARM_USERNAME, DeviceFarm, FarmDevice
+from netbox_config_backup.utilities.metrics import CollectionStats
+from netbox_config_backup.utilities.ssh_pool import SSHSessionPool
+from netbox_config_backup.utilities.vendors import get_profile
+
+
+class CaptureFallbackTest(SimpleTestCase):
+    """Capture strategies against the device farm, for the ways real devices end an exec channel"""
+
+    def capture(self, farm_device, strategies, profile=None, pool=None):
+        pool = pool or SSHSessionPool(idle_timeout=60)
+        stats = CollectionStats()
+        with pool.session(farm_device.host, FARM_USERNAME, FARM_PASSWORD, port=farm_device.port) as session:
+            output = capture_config(session, profile or get_profile('cisco'), stats, strategies, timeout=10)
+        return output, stats.strategy
+
+    def run_farm(self, **kwargs):
+        device = FarmDevice('cisco', lines=200, **kwargs)
+        farm = DeviceFarm([device])
+        farm.start()
+        self.addCleanup(farm.stop)
+        device.host = farm.host
+        return device
+
+    def test_shell_after_failed_exec_on_closed_connection(self):
+        # IOS drops the whole connection after an exec channel, the shell needs a new one
+        device = self.run_farm(exec_mode='close')
+        profile = copy.copy(get_profile('cisco'))
+        profile.exec_command = 'show startup-config'  # Not known to the farm: exit status 1
+        output, strategy = self.capture(device, ('exec', 'shell'), profile)
+        self.assertEqual(strategy, 'shell')
+        self.assertIn(device.config.splitlines()[-1], output)
+
+    def test_closed_connection_is_not_pooled(self):
+        device = self.run_farm(exec_mode='close')
+        pool = SSHSessionPool(idle_timeout=60)
+        for _ in range(2):
+            output, strategy = self.capture(device, ('exec',), pool=pool)
+            self.assertEqual(strategy, 'exec')
+        # A dead connection is never handed out again
+        self.assertEqual(pool.stats()['connects'], 2)
+
+    def test_exit_status_after_eof(self):
+        # OpenSSH based devices send EOF first, the exit status follows
+        device = self.run_farm(exec_mode='eof-first')
+        output, strategy = self.capture(device, ('exec',))
+        self.assertEqual(strategy, 'exec')
+        self.assertIn(device.config.splitlines()[-1], output)
+
+
+class StubChannel:
+    """
+    Hands out chunks one recv() at a time. A chunk in delayed arrives only after the reader
+    found nothing waiting (recv_ready() is False), the others are already there.
+    """
+
+    def __init__(self, *chunks, delayed=()):
+        self.chunks = list(chunks)
+        self.delayed = set(delayed)
+        self.received = 0
+        # Always readable, select() never blocks
+        self.read_fd, write_fd = os.pipe()
+        os.write(write_fd, b'x')
+        os.close(write_fd)
+
+    def close(self):
+        os.close(self.read_fd)
+
+    def fileno(self):
+        return self.read_fd
+
+    def recv_ready(self):
+        return self.received < len(self.chunks) and self.received not in self.delayed
+
+    def recv(self, size):
+        if self.received == len(self.chunks):
+            return b''
+        self.received += 1
+        return self.chunks[self.received - 1]
+
+
+class ReadUntilPromptTest(SimpleTestCase):
+    """Where read_until_prompt decides the output is complete"""
+
+    def read(self, *chunks, prompt=r'[>#]\s*$', delayed=()):
+        chan = StubChannel(*chunks, delayed=delayed)
+        self.addCleanup(chan.close)
+        buffer = read_until_prompt(chan, prompt, timeout=5)
+        return buffer, chan
+
+    def test_finished_line_looking_like_prompt(self):
+        # A chunk ends right after a line that matches the Huawei prompt, the rest comes later
+        buffer, chan = self.read(
+            b'interface GE0/0/1\n description <to-core>\n', b' shutdown\n#\n<sw1>',
+            prompt=r'<.*>\s*$', delayed={1},
+        )
+        self.assertTrue(buffer.prompt_seen)
+        self.assertEqual(chan.received, 2)
+        self.assertTrue(buffer.getvalue().endswith(' shutdown\n#\n<sw1>'))
+
+    def test_chunk_cut_mid_line(self):
+        # The cut line looks like a prompt, but the rest of it is already waiting
+        buffer, chan = self.read(b'hostname sw1\nip host a#', b'b 10.0.0.1\nend\nsw1#')
+        self.assertTrue(buffer.prompt_seen)
+        self.assertEqual(buffer.getvalue(), 'hostname sw1\nip host a#b 10.0.0.1\nend\nsw1#')
+
+    def test_chunk_ending_with_carriage_return(self):
+        # Cut between \r and \n: '\s*$' would match the \r, yet the line is finished
+        buffer, chan = self.read(
+            b'interface GE0/0/1\r\n description <to-core>\r', b'\n#\r\n<sw1>',
+            prompt=r'<.*>\s*$', delayed={1},
+        )
+        self.assertTrue(buffer.prompt_seen)
+        self.assertEqual(chan.received, 2)
+        self.assertTrue(buffer.getvalue().endswith('\n#\r\n<sw1>'))
+
+    def test_closed_before_prompt(self):
+        buffer, chan = self.read(b'hostname sw1\n', b'interface Gi1\n', delayed={1})
+        self.assertFalse(buffer.prompt_seen)
+        self.assertEqual(buffer.getvalue(), 'hostname sw1\ninterface Gi1\n')
@@ -0,0 +1,90 @@
+from unittest import mock
+from django.conf import settings
+from django.test import SimpleTestCase, TestCase, override_settings
+from rq.job import JobStatus
+from netbox_config_backup import jobs, tasks
+from netbox_config_backup.models import CollectionRun, ConfigBackup, DeviceBackupState
+from .utils import create_devices
+
+
+class EnqueueDevicesTest(SimpleTestCase):
+    """enqueue_devices on an in-process fakeredis (rq_fake_redis), no worker runs the jobs"""
+
+    def setUp(self):
+        plugins_config = {
+            **settings.PLUGINS_CONFIG,
+            'netbox_config_backup': {
+                **settings.PLUGINS_CONFIG['netbox_config_backup'],
+                'rq_fake_redis': True,
+                'collection_retry_intervals': [60, 300],
+                'collection_job_timeout': 120,
+            },
+        }
+        override = override_settings(PLUGINS_CONFIG=plugins_config)
+        override.enable()
+        self.addCleanup(override.disable)
+        # Fresh fake Redis for every test
+        jobs._fake_connection = None
+
+    def test_in_flight_devices_are_skipped_and_jobs_retry(self):
+        self.assertEqual(jobs.enqueue_devices([1, 2], run_id=7), ([1, 2], []))
+        # 2 is still queued from the first run, only 3 is new
+        self.assertEqual(jobs.enqueue_devices([2, 3], run_id=8), ([3], [2]))
+        self.assertEqual(len(jobs.get_queue()), 3)
+
+        job = jobs.get_device_job(2)
+        self.assertEqual(job.get_status(), JobStatus.QUEUED)
+        self.assertEqual(job.args, (2, 7))
+        self.assertEqual(job.retries_left, 2)
+        self.assertEqual(job.retry_intervals, [60, 300])
+        self.assertEqual(job.timeout, 120)
+        self.assertEqual(job.failure_ttl, 86400)
+
+        # Once the job is done the device can be enqueued again
+        job.set_status(JobStatus.FINISHED)
+        self.assertEqual(jobs.enqueue_devices([2], run_id=9), ([2], []))
+        self.assertEqual(jobs.get_device_job(2).args, (2, 9))
+
+
+class DisabledDuringCollectionTest(TestCase):
+    """Disable clicked while a scheduled collection of the device is queued or running"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.device, = create_devices(1)
+        ConfigBackup.objects.create(
+            device=cls.device, config='hostname sw0', last_status='Success',
+            status='Backup Enabled', collection_mode='AUTO',
+        )
+
+    def disable(self):
+        # What views.disable_backup stores
+        return ConfigBackup.objects.create(
+            device=self.device, config='', last_status='Disabled by user admin',
+            status='Backup Disabled', collection_mode='MANUAL',
+        )
+
+    def test_queued_job_does_nothing(self):
+        disabled = self.disable()
+        run = CollectionRun.objects.create(backend='rq', devices=1)
+        with mock.patch.object(jobs, 'backup_device_config') as collect:
+            self.assertEqual(jobs.collect_device_job(self.device.pk, run.pk), 'skipped')
+        collect.assert_not_called()
+        self.assertEqual(DeviceBackupState.get_latest(self.device.pk), disabled)
+        run.refresh_from_db()
+        self.assertEqual((run.devices, run.skipped), (0, 1))
+        self.assertIsNotNone(run.finished)
+
+    def test_changed_config_is_not_stored(self):
+        disabled = self.disable()
+        # last_hash as read before the Disable
+        outcome = tasks.store_scheduled_result(self.device, 'hostname sw0-new', 'Success', 'stale')
+        self.assertEqual(outcome, 'skipped')
+        self.assertEqual(DeviceBackupState.get_latest(self.device.pk), disabled)
+
+    def test_unchanged_config_is_not_rescheduled(self):
+        last_hash = DeviceBackupState.get_latest(self.device.pk).config_hash
+        self.disable()
+        outcome = tasks.store_scheduled_result(self.device, 'hostname sw0', 'Success', last_hash)
+        self.assertEqual(outcome, 'skipped')
+        self.assertIsNone(DeviceBackupState.objects.get(device=self.device).next_due)
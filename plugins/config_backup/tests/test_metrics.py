@@ -0,0 +1,45 @@
+from unittest import mock
+from django.test import TestCase
+from netbox_config_backup import jobs, tasks
+from netbox_config_backup.models import CollectionRun, CollectionTotals, ConfigBackup
+from netbox_config_backup.utilities.prometheus import render_metrics
+from netbox_config_backup.utilities.ssh_pool import get_ssh_pool
+from .utils import create_devices
+
+
+def connect_and_collect(device, *args):
+    # What a collection over a new SSH connection leaves in the pool counters
+    pool = get_ssh_pool()
+    pool.count('connects')
+    pool.count('connect_seconds', 0.25)
+    return f'hostname {device.name}', 'Success'
+
+
+class PoolCountersTest(TestCase):
+    """SSH pool counters of the cron and RQ collections reach CollectionTotals and the metrics endpoint"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.devices = create_devices(3)
+        for device in cls.devices:
+            ConfigBackup.objects.create(
+                device=device, config='hostname old', last_status='Success',
+                status='Backup Enabled', collection_mode='AUTO',
+            )
+
+    def test_scheduled_run(self):
+        with mock.patch.object(tasks, 'backup_device_config', connect_and_collect):
+            summary = tasks.collect_scheduled_backups(workers=2)
+        self.assertEqual(summary['pool'], {'connects': 3, 'connect_seconds': 0.75})
+        self.assertEqual(CollectionTotals.objects.get(source='schedule').pool, summary['pool'])
+        metrics = render_metrics().decode()
+        self.assertIn('netbox_config_backup_ssh_connects_total{source="schedule"} 3.0', metrics)
+        self.assertIn('netbox_config_backup_ssh_connect_seconds_total{source="schedule"} 0.75', metrics)
+        self.assertIn('netbox_config_backup_ssh_session_reuses_total{source="schedule"} 0.0', metrics)
+
+    def test_rq_jobs(self):
+        run = CollectionRun.objects.create(backend='rq', source='api', devices=len(self.devices))
+        with mock.patch.object(jobs, 'backup_device_config', connect_and_collect):
+            for device in self.devices:
+                self.assertEqual(jobs.collect_device_job(device.pk, run.pk), 'saved')
+        self.assertEqual(CollectionTotals.objects.get(source='api').pool, {'connects': 3, 'connect_seconds': 0.75})
@@ -0,0 +1,101 @@
+from django.conf import settings
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from netbox_config_backup.models import ConfigBackup, ConfigBlob, DeviceBackupState
+from netbox_config_backup.signals import fill_latest_pointers
+from netbox_config_backup.utilities.benchmarks import synthetic_history
+from .utils import create_devices
+
+
+class LatestPointerTest(TestCase):
+    """Backups saved before the pointer table existed"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.device, = create_devices(1)
+        for version in range(2):
+            cls.latest = ConfigBackup.objects.create(
+                device=cls.device, config=f'hostname sw0\n! v{version}', last_status='Success',
+                status='Backup Enabled', collection_mode='AUTO',
+            )
+
+    def setUp(self):
+        DeviceBackupState.objects.all().delete()
+
+    def test_filled_after_migrate(self):
+        self.assertEqual(DeviceBackupState.claim(['Backup Enabled']), [])
+        fill_latest_pointers(sender=None)
+        self.assertEqual(DeviceBackupState.objects.get(device=self.device).latest, self.latest)
+        self.assertEqual(DeviceBackupState.claim(['Backup Enabled']), [self.device.pk])
+
+    def test_get_latest_falls_back(self):
+        self.assertEqual(DeviceBackupState.get_latest(self.device.pk), self.latest)
+        self.assertEqual(DeviceBackupState.objects.get(device=self.device).latest, self.latest)
+
+
+class InternTest(TestCase):
+
+    def test_existing_blob_is_locked(self):
+        # Serializes with archive_old_backups' re-check of the same row
+        blob = ConfigBlob.intern('hostname sw0')
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(ConfigBlob.intern('hostname sw0'), blob)
+        self.assertEqual(len(queries), 1)
+        self.assertIn('FOR UPDATE', queries[0]['sql'])
+
+    def test_archived_blob_is_restored(self):
+        blob = ConfigBlob.intern('hostname sw0')
+        ConfigBlob.objects.filter(pk=blob.pk).update(text='', archive_locator='pack-1:0:10')
+        blob = ConfigBlob.intern('hostname sw0')
+        self.assertEqual((blob.text, blob.archive_locator), ('hostname sw0', ''))
+        self.assertEqual(ConfigBlob.objects.get(pk=blob.pk).text, 'hostname sw0')
+
+
+class DeltaStorageTest(TestCase):
+    """storage_mode 'delta' rewrites stored configs, every version must still read back as saved"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.device, = create_devices(1)
+
+    def setUp(self):
+        plugins_config = {
+            **settings.PLUGINS_CONFIG,
+            'netbox_config_backup': {
+                **settings.PLUGINS_CONFIG['netbox_config_backup'], 'storage_mode': 'delta', 'delta_chain_max': 4,
+            },
+        }
+        override = override_settings(PLUGINS_CONFIG=plugins_config)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def save_history(self, texts):
+        saved = []
+        for text in texts:
+            backup = ConfigBackup.objects.create(
+                device=self.device, config=text, last_status='Success', status='Backup Enabled', collection_mode='AUTO',
+            )
+            saved.append((backup.pk, text))
+        return saved
+
+    def assertRoundTrip(self, saved):
+        for pk, text in saved:
+            self.assertEqual(ConfigBackup.objects.get(pk=pk).config, text)
+
+    def test_history_crossing_snapshots(self):
+        saved = self.save_history(synthetic_history(11, lines=300))
+        self.assertRoundTrip(saved)
+        blobs = ConfigBlob.objects.filter(backups__device=self.device)
+        # Chains of at most three deltas in front of a full snapshot
+        self.assertEqual(blobs.filter(delta_base__isnull=True).count(), 3)
+        self.assertEqual(max(blobs.values_list('delta_run', flat=True)), 3)
+
+    def test_revert(self):
+        first, second = synthetic_history(2, lines=300)
+        saved = self.save_history([first, second, first, second, first])
+        self.assertRoundTrip(saved)
+        # The latest config is always kept in full
+        latest = DeviceBackupState.get_latest(self.device.pk)
+        self.assertIsNone(latest.blob.delta_base_id)
+        self.assertEqual(latest.blob.text, first)
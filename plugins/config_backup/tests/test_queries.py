@@ -0,0 +1,84 @@
+from unittest import mock
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.test import RequestFactory, TestCase, override_settings
+from netbox_config_backup import jobs, tasks
+from netbox_config_backup.models import ConfigBackup
+from netbox_config_backup.views import ConfigDiffView, DeviceConfigBackupView
+from .utils import create_devices
+
+HISTORY = 30
+
+
+def make_config(device, version):
+    lines = [f'interface Gi1/0/{n}\n description port-{n}-{device.pk}\n!' for n in range(100)]
+    lines[version % len(lines)] += f'\n description changed-{version}'
+    return '\n'.join(lines)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class QueryCountTest(TestCase):
+    """
+    Queries of the backups page, the compare page and a scheduled run. The views are
+    called without rendering: the template's share depends on the NetBox layout.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.devices = create_devices(3)
+        for device in cls.devices:
+            for version in range(HISTORY):
+                ConfigBackup.objects.create(
+                    device=device, config=make_config(device, version), last_status='Success',
+                    status='Backup Enabled', collection_mode='AUTO',
+                )
+
+    def setUp(self):
+        plugins_config = {
+            **settings.PLUGINS_CONFIG,
+            'netbox_config_backup': {**settings.PLUGINS_CONFIG['netbox_config_backup'], 'rq_fake_redis': True},
+        }
+        override = override_settings(PLUGINS_CONFIG=plugins_config)
+        override.enable()
+        self.addCleanup(override.disable)
+        jobs._fake_connection = None
+        cache.clear()
+
+    def get(self, view, path, **kwargs):
+        request = RequestFactory().get(path)
+        request.user = AnonymousUser()
+        response = view.as_view()(request, **kwargs)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_device_page(self):
+        device = self.devices[0]
+        # A full first page, the device's first backup (no predecessor) is on a later one
+        path = '/?per_page=20'
+        # First view also stores the line counts of the page: predecessor of the oldest row, blobs, one UPDATE
+        with self.assertNumQueries(6):
+            response = self.get(DeviceConfigBackupView, path, device_id=device.pk)
+        self.assertEqual(len(response.context_data['backups']), 20)
+        self.assertIsNotNone(response.context_data['backups'][0].lines_added)
+        # Count, page, device
+        with self.assertNumQueries(3):
+            self.get(DeviceConfigBackupView, path, device_id=device.pk)
+
+    def test_compare_page(self):
+        newer, older = ConfigBackup.objects.filter(device=self.devices[0]).order_by('-created')[:2]
+        path = f'/?selected={older.pk}&selected={newer.pk}'
+        # Both backups, then each blob
+        with self.assertNumQueries(4):
+            self.get(ConfigDiffView, path)
+        # Cached diff, the config text isn't loaded
+        with self.assertNumQueries(2):
+            self.get(ConfigDiffView, path)
+
+    def test_scheduled_run(self):
+        latest = {device.pk: make_config(device, HISTORY - 1) for device in self.devices}
+        with mock.patch.object(tasks, 'backup_device_config', lambda device, *args: (latest[device.pk], 'Success')):
+            # Per device one UPDATE of its schedule, the rest is per run (savepoints included)
+            with self.assertNumQueries(14 + len(self.devices)):
+                summary = tasks.collect_scheduled_backups(workers=1)
+        self.assertEqual(summary['unchanged'], len(self.devices))
@@ -0,0 +1,95 @@
+from datetime import datetime, timedelta, timezone
+from io import StringIO
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils.timezone import now
+from netbox_config_backup.models import ConfigBackup, ConfigBlob
+from netbox_config_backup.utilities.retention import find_expired_backups
+from .utils import create_devices
+
+# A Monday: twice a day for ten weeks, the newest is Sunday 2024-03-10 12:00
+START = datetime(2024, 1, 1, tzinfo=timezone.utc)
+DAYS = 70
+
+
+class RetentionTest(TestCase):
+    """The windowed RETENTION_SQL query behind cleanup_old_backups"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.device, cls.other = create_devices(2)
+
+    def create_backups(self, device, times):
+        backups = {}
+        for created in times:
+            backup = ConfigBackup.objects.create(
+                device=device, config=f'hostname {device.name}\n! {created.isoformat()}', last_status='Success',
+                status='Backup Enabled', collection_mode='AUTO',
+            )
+            ConfigBackup.objects.filter(pk=backup.pk).update(created=created)
+            backups[created] = backup.pk
+        return backups
+
+    def create_history(self, device):
+        return self.create_backups(device, [
+            START + timedelta(days=day, hours=hour) for day in range(DAYS) for hour in (6, 12)
+        ])
+
+    def kept(self, backups, **options):
+        expired = {backup_id for backup_id, _, _ in find_expired_backups(**options)}
+        return sorted(created for created, pk in backups.items() if pk not in expired)
+
+    def test_keep_and_threshold(self):
+        small = self.create_backups(self.other, [START + timedelta(days=day) for day in range(15)])
+        large = self.create_backups(self.device, [START + timedelta(days=day) for day in range(16)])
+        expired = find_expired_backups(keep=3, threshold=15)
+        # Only the device above the threshold, all but its newest three
+        self.assertEqual(sorted(backup_id for backup_id, _, _ in expired), sorted(large.values())[:13])
+        self.assertEqual({(device_id, name) for _, device_id, name in expired}, {(self.device.pk, self.device.name)})
+        self.assertEqual(len(self.kept(small, keep=3, threshold=14)), 3)
+
+    def test_max_age(self):
+        current = now()
+        backups = self.create_backups(self.device, [current - timedelta(days=age, hours=1) for age in range(20)])
+        kept = self.kept(backups, keep=3, threshold=0, max_age_days=10)
+        self.assertEqual(kept, sorted(current - timedelta(days=age, hours=1) for age in range(10)))
+
+    def test_buckets(self):
+        backups = self.create_history(self.device)
+
+        def noon(month, day):
+            return datetime(2024, month, day, 12, tzinfo=timezone.utc)
+
+        self.assertEqual(self.kept(backups, keep=1, threshold=0, daily=3), [noon(3, 8), noon(3, 9), noon(3, 10)])
+        # Weeks start on Monday
+        self.assertEqual(self.kept(backups, keep=1, threshold=0, weekly=2), [noon(3, 3), noon(3, 10)])
+        self.assertEqual(self.kept(backups, keep=1, threshold=0, monthly=3), [noon(1, 31), noon(2, 29), noon(3, 10)])
+        self.assertEqual(
+            self.kept(backups, keep=1, threshold=0, daily=2, weekly=2, monthly=2),
+            [noon(2, 29), noon(3, 3), noon(3, 9), noon(3, 10)]
+        )
+
+    def test_newest_is_never_deleted(self):
+        backups = self.create_history(self.device)
+        single = self.create_backups(self.other, [START])
+        self.assertEqual(self.kept(backups, keep=0, threshold=0), [max(backups)])
+        self.assertEqual(self.kept(single, keep=0, threshold=0), [START])
+
+    def test_dry_run_matches_delete(self):
+        self.create_history(self.device)
+        self.create_history(self.other)
+        options = {'keep': 5, 'threshold': 10, 'daily': 7, 'weekly': 4, 'monthly': 2}
+        expected = {backup_id for backup_id, _, _ in find_expired_backups(**options)}
+        total = ConfigBackup.objects.count()
+
+        output = call_command('cleanup_old_backups', dry_run=True, stdout=StringIO(), **options)
+        self.assertEqual(output, f'Dry run complete. Would delete {len(expected)} backups.')
+        self.assertEqual(ConfigBackup.objects.count(), total)
+
+        output = call_command('cleanup_old_backups', stdout=StringIO(), **options)
+        self.assertEqual(output, f'Cleanup complete. Deleted {len(expected)} backups.')
+        remaining = set(ConfigBackup.objects.values_list('pk', flat=True))
+        self.assertFalse(remaining & expected)
+        self.assertEqual(len(remaining), total - len(expected))
+        # Configs only the deleted backups referred to are gone as well
+        self.assertFalse(ConfigBlob.objects.filter(backups__isnull=True).exists())
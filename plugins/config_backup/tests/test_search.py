@@ -0,0 +1,36 @@
+from django.contrib.auth.models import AnonymousUser
+from django.test import RequestFactory, TestCase
+from netbox_config_backup.models import ConfigBackup
+from netbox_config_backup.utilities.search import search_latest_configs
+from netbox_config_backup.views import ConfigSearchView
+from .utils import create_devices
+
+
+class SearchTruncationTest(TestCase):
+    """More matching devices than the limit is reported, not silently cut"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.devices = create_devices(3)
+        for device in cls.devices:
+            ConfigBackup.objects.create(
+                device=device, config=f'hostname {device.name}\nsnmp-server community public RO', last_status='Success',
+                status='Backup Enabled', collection_mode='AUTO',
+            )
+
+    def test_limit(self):
+        results, truncated = search_latest_configs('community public', limit=2)
+        self.assertTrue(truncated)
+        self.assertEqual([result['device'] for result in results], sorted(self.devices, key=lambda device: device.name)[:2])
+        self.assertEqual(results[0]['matches'], [(2, 'snmp-server community public RO')])
+        results, truncated = search_latest_configs('community public', limit=3)
+        self.assertFalse(truncated)
+        self.assertEqual(len(results), 3)
+
+    def test_view(self):
+        request = RequestFactory().get('/', {'q': 'community public', 'limit': 2})
+        request.user = AnonymousUser()
+        context = ConfigSearchView.as_view()(request).context_data
+        self.assertTrue(context['truncated'])
+        self.assertEqual(len(context['results']), 2)
+        self.assertEqual(context['more_url'], '?q=community+public&limit=1000')
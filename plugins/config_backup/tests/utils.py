@@ -0,0 +1,17 @@
+from dcim.models import Device, DeviceRole, DeviceType, Manufacturer, Site
+from ipam.models import IPAddress
+
+
+def create_devices(count):
+    """count active Cisco devices with a primary IPv4 address"""
+    site = Site.objects.create(name='dc1', slug='dc1')
+    manufacturer = Manufacturer.objects.create(name='Cisco', slug='cisco')
+    device_type = DeviceType.objects.create(manufacturer=manufacturer, model='C9300', slug='c9300')
+    role = DeviceRole.objects.create(name='Access', slug='access')
+    devices = []
+    for n in range(count):
+        device = Device.objects.create(name=f'sw{n}', site=site, device_type=device_type, role=role)
+        device.primary_ip4 = IPAddress.objects.create(address=f'10.0.0.{n + 1}/24')
+        device.save()
+        devices.append(device)
+    return devices
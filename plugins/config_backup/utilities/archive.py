@@ -0,0 +1,191 @@
+import fcntl
+import mmap
+import os
+import threading
+import zlib
+import logging
+from netbox.plugins import get_plugin_config
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+PLUGIN_NAME = 'netbox_config_backup'
+
+# Pack layout: 8-byte header (magic + codec), then independently compressed
+# records. A sidecar .idx file lists "digest offset length" per record.
+PACK_MAGIC = b'CBPACK'
+CODEC_ZSTD = b'Z'
+CODEC_ZLIB = b'D'
+HEADER_SIZE = len(PACK_MAGIC) + 2
+
+_maps = {}
+_maps_lock = threading.Lock()
+
+
+def get_archive_path():
+    return get_plugin_config(PLUGIN_NAME, 'archive_path')
+
+
+def _compress(codec, data):
+    level = get_plugin_config(PLUGIN_NAME, 'archive_compression_level')
+    if codec == CODEC_ZSTD:
+        return zstandard.ZstdCompressor(level=level).compress(data)
+    return zlib.compress(data, min(level, 9))
+
+
+def _decompress(codec, data):
+    if codec == CODEC_ZSTD:
+        if zstandard is None:
+            raise RuntimeError("Archived config is zstd-compressed but the zstandard package is not installed")
+        return zstandard.ZstdDecompressor().decompress(data)
+    return zlib.decompress(data)
+
+
+def format_locator(pack_name, offset, length):
+    return f'{pack_name}:{offset}:{length}'
+
+
+def parse_locator(locator):
+    pack_name, offset, length = locator.rsplit(':', 2)
+    return pack_name, int(offset), int(length)
+
+
+def _get_map(path, end):
+    """Memory-mapped pack, remapped when the pack has grown past the cached view"""
+    with _maps_lock:
+        entry = _maps.get(path)
+        if entry is None or len(entry) < end:
+            with open(path, 'rb') as f:
+                entry = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            _maps[path] = entry
+        return entry
+
+
+def read_archived(locator):
+    pack_name, offset, length = parse_locator(locator)
+    path = os.path.join(get_archive_path(), pack_name)
+    view = _get_map(path, offset + length)
+    codec = view[len(PACK_MAGIC):len(PACK_MAGIC) + 1]
+    return _decompress(codec, view[offset:offset + length]).decode()
+
+
+class PackWriter:
+    """
+    Appends records to the current pack, starting a new one once it exceeds
+    archive_pack_size. Holds an exclusive lock on the archive directory.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or get_archive_path()
+        self.max_size = get_plugin_config(PLUGIN_NAME, 'archive_pack_size')
+        self.codec = CODEC_ZSTD if zstandard is not None else CODEC_ZLIB
+        self.pack = None
+        self.index = None
+        self.pack_name = None
+
+    def __enter__(self):
+        os.makedirs(self.path, exist_ok=True)
+        self.lock = open(os.path.join(self.path, '.lock'), 'w')
+        fcntl.flock(self.lock, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        self.flush()
+        self._close()
+        fcntl.flock(self.lock, fcntl.LOCK_UN)
+        self.lock.close()
+
+    def _close(self):
+        if self.pack:
+            self.pack.close()
+            self.index.close()
+        self.pack = self.index = None
+
+    def _open_pack(self):
+        packs = sorted(name for name in os.listdir(self.path) if name.endswith('.pack'))
+        if packs:
+            name = packs[-1]
+            size = os.path.getsize(os.path.join(self.path, name))
+            with open(os.path.join(self.path, name), 'rb') as f:
+                codec = f.read(HEADER_SIZE)[len(PACK_MAGIC):len(PACK_MAGIC) + 1]
+            if size < self.max_size and codec == self.codec:
+                return name
+            number = int(name[len('pack-'):-len('.pack')]) + 1
+        else:
+            number = 1
+        name = f'pack-{number:06d}.pack'
+        with open(os.path.join(self.path, name), 'wb') as f:
+            f.write(PACK_MAGIC + self.codec + b'\n')
+        return name
+
+    def append(self, digest, text):
+        """Write one config and return its locator"""
+        if self.pack is None or self.pack.tell() >= self.max_size:
+            self.flush()
+            self._close()
+            self.pack_name = self._open_pack()
+            self.pack = open(os.path.join(self.path, self.pack_name), 'ab')
+            self.index = open(os.path.join(self.path, self.pack_name[:-len('.pack')] + '.idx'), 'a')
+        data = _compress(self.codec, text.encode())
+        offset = self.pack.tell()
+        self.pack.write(data)
+        self.index.write(f'{digest} {offset} {len(data)}\n')
+        return format_locator(self.pack_name, offset, len(data))
+
+    def flush(self):
+        """Make everything appended so far durable before the database points at it"""
+        if self.pack:
+            self.pack.flush()
+            os.fsync(self.pack.fileno())
+            self.index.flush()
+            os.fsync(self.index.fileno())
+
+
+def archive_blobs(cutoff, batch_size=200, dry_run=False):
+    """
+    Move configs only referenced by backups older than cutoff (and not the
+    latest backup of any device) into pack files. Returns (blobs, bytes).
+    """
+    from django.db import transaction
+    from django.db.models import Exists, OuterRef
+    from ..models import ConfigBackup, ConfigBlob, DeviceBackupState
+
+    # Deltas are small and stay in the database
+    candidates = ConfigBlob.objects.filter(archive_locator='', delta_base__isnull=True).filter(
+        Exists(ConfigBackup.objects.filter(blob=OuterRef('pk')))
+    ).exclude(
+        Exists(ConfigBackup.objects.filter(blob=OuterRef('pk'), created__gte=cutoff))
+    ).exclude(
+        Exists(DeviceBackupState.objects.filter(latest__blob=OuterRef('pk')))
+    ).order_by('pk')
+
+    if dry_run:
+        return candidates.count(), sum(candidates.values_list('size', flat=True))
+
+    archived = archived_bytes = 0
+    last_pk = 0
+    with PackWriter() as writer:
+        while True:
+            batch = list(candidates.filter(pk__gt=last_pk).values_list('pk', 'digest', 'text')[:batch_size])
+            if not batch:
+                break
+            locators = {pk: writer.append(digest, text) for pk, digest, text in batch}
+            writer.flush()
+            with transaction.atomic():
+                # Lock the rows and check again: since the batch was read a new backup may have made
+                # a blob some device's latest, intern() may have restored it or it became a delta.
+                # intern() takes the same row lock and keeps it until the new backup is the latest
+                locked = ConfigBlob.objects.select_for_update().filter(pk__in=list(locators)).values_list('pk', flat=True)
+                still_candidates = set(candidates.filter(pk__in=list(locked)).values_list('pk', flat=True))
+                for pk in still_candidates:
+                    ConfigBlob.objects.filter(pk=pk).update(text='', archive_locator=locators[pk])
+            # Records of blobs left out stay in the pack as dead space
+            archived += len(still_candidates)
+            archived_bytes += sum(len(text) for pk, _, text in batch if pk in still_candidates)
+            last_pk = batch[-1][0]
+            logger.info(f"Archived {archived} configs ({archived_bytes} bytes)")
+    return archived, archived_bytes
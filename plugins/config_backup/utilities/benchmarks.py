@@ -0,0 +1,300 @@
+import random
+import time
+from django.db import connection, transaction
+from .delta import delta_size
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def table_sizes(models):
+    """Total on-disk size (table, indexes and TOAST) of each model's table in bytes"""
+    sizes = {}
+    with connection.cursor() as cursor:
+        for model in models:
+            cursor.execute('SELECT pg_total_relation_size(%s)', [model._meta.db_table])
+            sizes[model._meta.db_table] = cursor.fetchone()[0]
+    return sizes
+
+
+def time_reads(blobs, rounds=3):
+    """Per-read latencies in seconds for ConfigBlob.get_text()"""
+    latencies = []
+    for _ in range(rounds):
+        for blob in blobs:
+            started = time.perf_counter()
+            blob.get_text()
+            latencies.append(time.perf_counter() - started)
+    return latencies
+
+
+def benchmark_archive(samples=200):
+    """Database footprint of the blob store and read latency of inline vs archived configs"""
+    from ..models import ConfigBackup, ConfigBlob
+
+    result = {'sizes': table_sizes([ConfigBackup, ConfigBlob])}
+    for label, blobs in (
+        ('inline', ConfigBlob.objects.filter(archive_locator='')),
+        ('archived', ConfigBlob.objects.exclude(archive_locator='')),
+    ):
+        ids = list(blobs.values_list('pk', flat=True))
+        picked = ConfigBlob.objects.filter(pk__in=random.sample(ids, min(samples, len(ids))))
+        # Load rows up front so only the text read itself is timed
+        latencies = time_reads(list(picked))
+        result[label] = {
+            'count': len(ids),
+            'bytes': sum(blobs.values_list('size', flat=True)),
+            'reads': len(latencies),
+            'p50': percentile(latencies, 0.5),
+            'p99': percentile(latencies, 0.99),
+        }
+    return result
+
+
+def synthetic_history(versions, lines=3000, changes=5, seed=1):
+    """Config texts, oldest first, each differing from the previous by a few edited lines"""
+    rng = random.Random(seed)
+    config = []
+    for number in range(lines // 3):
+        config += [f'interface GigabitEthernet0/{number}', f' description port {number}', '!']
+    for version in range(versions):
+        for _ in range(changes):
+            position = rng.randrange(len(config))
+            action = rng.random()
+            if action < 0.6:
+                config[position] = f' description changed in version {version}'
+            elif action < 0.8:
+                config.insert(position, f' switchport access vlan {rng.randrange(4096)}')
+            elif len(config) > 1:
+                del config[position]
+        yield '\n'.join(config)
+
+
+def benchmark_delta(device, versions=2000, chain_max=50, samples=200):
+    """
+    Save a synthetic history for device through ConfigBackup.save() with
+    storage_mode 'delta' and measure storage against full copies and the
+    rebuild of sampled versions (one delta_base query per hop). Everything
+    is rolled back afterwards.
+    """
+    from django.conf import settings
+    from django.test.utils import CaptureQueriesContext, override_settings
+    from ..models import ConfigBackup, ConfigBlob
+
+    plugins_config = {
+        **settings.PLUGINS_CONFIG,
+        'netbox_config_backup': {
+            **settings.PLUGINS_CONFIG.get('netbox_config_backup', {}),
+            'storage_mode': 'delta',
+            'delta_chain_max': chain_max,
+        },
+    }
+    with override_settings(PLUGINS_CONFIG=plugins_config), transaction.atomic():
+        texts = {}
+        full_bytes = 0
+        started = time.perf_counter()
+        for text in synthetic_history(versions):
+            backup = ConfigBackup(
+                device=device, config=text, last_status='Success', status='Backup Disabled', collection_mode='AUTO'
+            )
+            backup.save()
+            texts[backup.pk] = text
+            full_bytes += len(text)
+        build_time = time.perf_counter() - started
+
+        blobs = ConfigBlob.objects.filter(backups__pk__in=list(texts)).distinct()
+        stored_bytes = sum(
+            len(text) if delta is None else delta_size(delta)
+            for text, delta in blobs.values_list('text', 'delta')
+        )
+        latencies, hops, mismatches = [], [], 0
+        for pk in random.Random(2).sample(list(texts), min(samples, len(texts))):
+            backup = ConfigBackup.objects.select_related('blob').get(pk=pk)
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                config = backup.config
+                latencies.append(time.perf_counter() - started)
+            hops.append(len(queries))
+            mismatches += config != texts[pk]
+        result = {
+            'versions': len(texts),
+            'snapshots': blobs.filter(delta_base__isnull=True).count(),
+            'full_bytes': full_bytes,
+            'stored_bytes': stored_bytes,
+            'build_time': build_time,
+            'max_chain': max(hops, default=0),
+            'mismatches': mismatches,
+            'p50': percentile(latencies, 0.5),
+            'p99': percentile(latencies, 0.99),
+            'max': max(latencies, default=0.0),
+        }
+        transaction.set_rollback(True)
+    return result
+
+
+def _collection_stats(latencies, failures, wall):
+    return {
+        'devices': len(latencies),
+        'failed': failures,
+        'wall': wall,
+        'per_second': len(latencies) / wall if wall else 0.0,
+        'p50': percentile(latencies, 0.5),
+        'p99': percentile(latencies, 0.99),
+    }
+
+
+def benchmark_collection(count=50, lines=2000, latency=0.02, workers=10, failure=None, failure_rate=0.0,
+                         legacy_samples=3):
+    """
+    Collect from a simulated device farm through every collection path:
+    backup_device_config one device at a time, the same through
+    collect_in_parallel, and the legacy utils.get_device_config.
+    """
+    from ..tasks import collect_in_parallel
+    from ..utils import get_device_config
+    from .backup_utils import backup_device_config
+    from .device_farm import FARM_PASSWORD, FARM_USERNAME, build_farm
+    from .ssh_pool import get_ssh_pool
+
+    pool = get_ssh_pool()
+    results = {}
+    with build_farm(count, lines, latency, failure, failure_rate) as farm:
+        devices = farm.netbox_devices()
+
+        pool.close_all()
+        latencies, failures = [], 0
+        started = time.perf_counter()
+        for device in devices:
+            device_started = time.perf_counter()
+            config, status = backup_device_config(device, FARM_USERNAME, FARM_PASSWORD)
+            latencies.append(time.perf_counter() - device_started)
+            failures += config is None
+        results['sequential'] = _collection_stats(latencies, failures, time.perf_counter() - started)
+
+        for label in ('parallel', 'parallel (pooled sessions)'):
+            # First round opens new sessions, the second reuses the ones the first left in the pool
+            if label == 'parallel':
+                pool.close_all()
+            latencies, failures = [], 0
+
+            def on_result(device, result, elapsed):
+                nonlocal failures
+                latencies.append(elapsed)
+                failures += result[0] is None
+
+            started = time.perf_counter()
+            collect_in_parallel(
+                devices,
+                lambda device: backup_device_config(device, FARM_USERNAME, FARM_PASSWORD),
+                on_result,
+                workers=workers,
+            )
+            results[label] = _collection_stats(latencies, failures, time.perf_counter() - started)
+
+        pool.close_all()
+        latencies, failures = [], 0
+        started = time.perf_counter()
+        for device in devices[:legacy_samples]:
+            device_started = time.perf_counter()
+            try:
+                get_device_config(
+                    str(device.primary_ip.address.ip), FARM_USERNAME, FARM_PASSWORD,
+                    device.device_type.manufacturer.name, port=device.custom_field_data['ssh_port'],
+                )
+            except Exception:
+                failures += 1
+            latencies.append(time.perf_counter() - device_started)
+        results['legacy get_device_config'] = _collection_stats(latencies, failures, time.perf_counter() - started)
+        pool.close_all()
+    return results
+
+
+def benchmark_clean(size_mb=8, rounds=5):
+    """clean_config throughput per vendor profile on raw-looking output of about size_mb"""
+    from .device_farm import VENDORS, generate_config
+    from .vendors import get_vendor_profile
+
+    results = {}
+    for vendor, options in VENDORS.items():
+        # CRLF line ends and the command echo, as they come off the channel
+        sample = generate_config(vendor, 5000).replace('\n', '\r\n')
+        raw = f"{options['show_config']}\r\n" + '\r\n'.join([sample] * max(1, int(size_mb * 1024 * 1024 / len(sample))))
+        profile = get_vendor_profile(options['manufacturer'])
+        timings = []
+        for _ in range(rounds):
+            started = time.perf_counter()
+            profile.clean(raw)
+            timings.append(time.perf_counter() - started)
+        best = min(timings)
+        results[profile.key] = {
+            'bytes': len(raw),
+            'lines': raw.count('\n') + 1,
+            'best': best,
+            'median': percentile(timings, 0.5),
+            'mb_per_second': len(raw) / 1024 / 1024 / best if best else 0.0,
+        }
+    return results
+
+
+def benchmark_capture(count=20, lines=2000, latency=0.02, workers=10, strategies=('shell', 'exec', 'scp', 'sftp', 'netconf')):
+    """
+    Collect the same simulated farm once per capture strategy through pooled
+    sessions. 'differs' counts devices whose cleaned config isn't the one the
+    first strategy returned.
+    """
+    import copy
+    from ..tasks import collect_in_parallel
+    from .capture import capture_config
+    from .device_farm import FARM_PASSWORD, FARM_USERNAME, build_farm
+    from .metrics import CollectionStats
+    from .ssh_pool import get_ssh_pool
+    from .vendors import get_vendor_profile
+
+    pool = get_ssh_pool()
+    results = {}
+    reference = {}
+    with build_farm(count, lines, latency) as farm:
+        devices = farm.netbox_devices()
+        profiles = {}
+        for device in devices:
+            manufacturer = device.device_type.manufacturer.name
+            if manufacturer not in profiles:
+                # The farm serves its running config under any path
+                profile = copy.copy(get_vendor_profile(manufacturer))
+                profile.scp_path = profile.sftp_path = 'running-config'
+                profiles[manufacturer] = profile
+
+        def capture(device, name):
+            profile = profiles[device.device_type.manufacturer.name]
+            stats = CollectionStats()
+            try:
+                with pool.session(device.primary_ip.address.ip, FARM_USERNAME, FARM_PASSWORD,
+                                  port=device.custom_field_data['ssh_port'], timeout=15, stats=stats) as session:
+                    return profile.clean(capture_config(session, profile, stats, (name,), timeout=30))
+            except Exception:
+                return None
+
+        for name in strategies:
+            # Warm the pool so only the capture itself is compared
+            pool.close_all()
+            collect_in_parallel(devices, lambda device: capture(device, 'exec'), lambda *args: None, workers=workers)
+            latencies, failures, differs = [], 0, 0
+
+            def on_result(device, config, elapsed):
+                nonlocal failures, differs
+                latencies.append(elapsed)
+                if config is None:
+                    failures += 1
+                elif reference.setdefault(device.pk, config) != config:
+                    differs += 1
+
+            started = time.perf_counter()
+            collect_in_parallel(devices, lambda device: capture(device, name), on_result, workers=workers)
+            results[name] = _collection_stats(latencies, failures, time.perf_counter() - started)
+            results[name]['differs'] = differs
+        pool.close_all()
+    return results
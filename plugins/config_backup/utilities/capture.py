@@ -0,0 +1,312 @@
+import codecs
+import gzip
+import re
+import select
+import time
+import logging
+import xml.etree.ElementTree as ET
+from .vendors import DEFAULT_PROMPT
+
+logger = logging.getLogger(__name__)
+
+class CaptureBuffer:
+    """Channel output collected as a list of chunks plus a short tail used for prompt checks"""
+
+    def __init__(self, tail_size=1024):
+        self.chunks = []
+        self.size = 0
+        self.tail = ''
+        self.tail_size = tail_size
+        # Set by read_until_prompt once the output ended with a prompt
+        self.prompt_seen = False
+        # Incremental decoder keeps multi-byte characters split across reads intact
+        self._decoder = codecs.getincrementaldecoder('utf-8')(errors='ignore')
+
+    def feed(self, data):
+        text = self._decoder.decode(data)
+        if text:
+            self.chunks.append(text)
+            self.size += len(text)
+            self.tail = (self.tail + text)[-self.tail_size:]
+
+    def last_line(self):
+        """The unterminated line at the end of the output, '' if the output ends with a newline"""
+        line = self.tail.rsplit('\n', 1)[-1]
+        # A chunk can end between \r and \n, that line is finished too
+        return '' if line.endswith('\r') else line
+
+    def getvalue(self):
+        return ''.join(self.chunks)
+
+def read_until_prompt(chan, prompt_regex=DEFAULT_PROMPT, timeout=30, stats=None):
+    """
+    Read from the channel until the prompt shows up, the channel closes or the deadline passes.
+    Time blocked waiting for the device and bytes received go to stats, if given.
+    """
+    if isinstance(prompt_regex, str):
+        prompt_regex = re.compile(prompt_regex)
+    buffer = CaptureBuffer()
+    deadline = time.monotonic() + timeout
+
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        # Block until the device sends something instead of polling with sleeps
+        if not chan.recv_ready():
+            waited = time.perf_counter()
+            readable, _, _ = select.select([chan], [], [], remaining)
+            if stats is not None:
+                stats.add('prompt_wait', time.perf_counter() - waited)
+            if not readable:
+                break
+        chunk = chan.recv(65535)
+        if not chunk:
+            break  # Channel closed
+        if stats is not None:
+            stats.bytes_received += len(chunk)
+        buffer.feed(chunk)
+        # Only the tail is checked, so long outputs stay linear. A prompt is never followed by a
+        # newline, so finished lines like ' description <to-core>' can't end the read; one cut at
+        # a chunk boundary can look like a prompt, but then the rest of it is already waiting
+        line = buffer.last_line()
+        if line and prompt_regex.search(line) and not chan.recv_ready():
+            buffer.prompt_seen = True
+            break
+    return buffer
+
+def wait_for_prompt(chan, prompt_regex=DEFAULT_PROMPT, timeout=30, stats=None):
+    return read_until_prompt(chan, prompt_regex, timeout, stats).getvalue()
+
+def read_config_output(chan, prompt_regex, timeout=120, stats=None):
+    """Config dump up to the prompt; a closed channel or timeout before it means the output is cut short"""
+    buffer = read_until_prompt(chan, prompt_regex, timeout, stats)
+    if not buffer.prompt_seen:
+        raise ConnectionError(f"Output ended before the prompt after {buffer.size} characters")
+    return buffer.getvalue()
+
+
+def read_until_eof(chan, timeout=120, stats=None):
+    """Read a non-interactive channel until the device closes it; no prompt detection needed"""
+    buffer = CaptureBuffer()
+    deadline = time.monotonic() + timeout
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise TimeoutError(f"No EOF after {timeout}s ({buffer.size} characters read)")
+        if not chan.recv_ready():
+            waited = time.perf_counter()
+            readable, _, _ = select.select([chan], [], [], remaining)
+            if stats is not None:
+                stats.add('prompt_wait', time.perf_counter() - waited)
+            if not readable:
+                continue
+        chunk = chan.recv(65535)
+        if not chunk:
+            return buffer
+        if stats is not None:
+            stats.bytes_received += len(chunk)
+        buffer.feed(chunk)
+
+def _close(channel):
+    # The device may already have dropped the connection (IOS does after exec); the output is complete either way
+    try:
+        channel.close()
+    except Exception:
+        pass
+
+class CaptureUnsupported(Exception):
+    """The vendor profile has no settings for this strategy"""
+
+# name -> function(session, profile, stats, timeout) returning the raw config text
+CAPTURE_STRATEGIES = {}
+
+def capture_strategy(name):
+    def register(function):
+        CAPTURE_STRATEGIES[name] = function
+        return function
+    return register
+
+@capture_strategy('shell')
+def capture_shell(session, profile, stats, timeout=120):
+    """Interactive CLI scraping: works everywhere, slowest and relies on prompt detection"""
+    prompt = profile.prompt
+    with stats.phase('shell'):
+        chan = session.invoke_shell()
+        read_until_prompt(chan, prompt, stats=stats)  # Wait for shell to initialize, clear banner
+    try:
+        with stats.phase('commands'):
+            # Paging off, enable and the like
+            for command in profile.setup_commands:
+                chan.send(command + '\n')
+                read_until_prompt(chan, prompt, stats=stats)
+
+            chan.send(profile.config_command + '\n')
+            output = read_config_output(chan, prompt, timeout=timeout, stats=stats)
+    finally:
+        _close(chan)
+    # The trailing prompt isn't config; without it the result matches the other strategies
+    # and falling back from exec to shell doesn't show up as a change
+    head, _, last = output.rstrip().rpartition('\n')
+    return head if prompt.search(last) else output
+
+@capture_strategy('exec')
+def capture_exec(session, profile, stats, timeout=120):
+    """One-shot exec request: no pty, so no paging, echo or prompts"""
+    deadline = time.monotonic() + timeout
+    with stats.phase('commands'):
+        chan = session.open_session()
+        try:
+            chan.exec_command(profile.exec_command or profile.config_command)
+            output = read_until_eof(chan, timeout, stats).getvalue()
+            # OpenSSH based devices often send EOF before the exit status
+            chan.status_event.wait(max(0.0, deadline - time.monotonic()))
+            status = chan.exit_status if chan.exit_status_ready() else -1
+        finally:
+            _close(chan)
+    # -1: no exit status before the deadline, the output may be cut short
+    if status != 0 or not output.strip():
+        raise ConnectionError(f"exec returned status {status} with {len(output)} characters")
+    return output
+
+def _read_scp_line(chan):
+    line = b''
+    while not line.endswith(b'\n'):
+        data = chan.recv(1)
+        if not data:
+            raise EOFError("SCP channel closed")
+        line += data
+    return line
+
+@capture_strategy('scp')
+def capture_scp(session, profile, stats, timeout=120):
+    """Pull profile.scp_path with the SCP source protocol (scp -f) over an exec channel"""
+    if not profile.scp_path:
+        raise CaptureUnsupported("no scp_path")
+    with stats.phase('commands'):
+        chan = session.open_session()
+        chan.settimeout(timeout)
+        try:
+            chan.exec_command(f'scp -f {profile.scp_path}')
+            chan.sendall(b'\0')
+            header = _read_scp_line(chan)
+            if not header.startswith(b'C'):
+                raise ConnectionError(f"SCP: {header[1:].decode(errors='ignore').strip() or 'refused'}")
+            size = int(header.split()[1])
+            chan.sendall(b'\0')
+            data = bytearray()
+            while len(data) < size + 1:  # File plus the trailing status byte
+                chunk = chan.recv(min(65535, size + 1 - len(data)))
+                if not chunk:
+                    raise EOFError(f"SCP channel closed after {len(data)} of {size} bytes")
+                data += chunk
+            chan.sendall(b'\0')
+        finally:
+            _close(chan)
+    stats.bytes_received += size
+    return _decode_file(profile.scp_path, bytes(data[:size]))
+
+@capture_strategy('sftp')
+def capture_sftp(session, profile, stats, timeout=120):
+    """Read profile.sftp_path through the SFTP subsystem"""
+    if not profile.sftp_path:
+        raise CaptureUnsupported("no sftp_path")
+    with stats.phase('commands'):
+        sftp = session.open_sftp()
+        try:
+            sftp.get_channel().settimeout(timeout)
+            with sftp.open(profile.sftp_path, 'rb') as remote:
+                data = remote.read()
+        finally:
+            _close(sftp)
+    stats.bytes_received += len(data)
+    return _decode_file(profile.sftp_path, data)
+
+def _decode_file(path, data):
+    if path.endswith('.gz'):
+        data = gzip.decompress(data)
+    return data.decode('utf-8', errors='ignore')
+
+NETCONF_DELIMITER = ']]>]]>'
+NETCONF_HELLO = (
+    '<?xml version="1.0" encoding="UTF-8"?>'
+    '<hello xmlns="urn:ietf:params:xml:ns:netconf:base:1.0">'
+    '<capabilities><capability>urn:ietf:params:netconf:base:1.0</capability></capabilities>'
+    '</hello>' + NETCONF_DELIMITER
+)
+NETCONF_GET_CONFIG = '<get-config><source><running/></source></get-config>'
+# Replies whose config comes back as plain text (e.g. Junos format="set"/"text")
+NETCONF_TEXT_ELEMENTS = ('configuration-text', 'configuration-set', 'config-text')
+
+def _read_netconf_message(chan, deadline, stats):
+    buffer = CaptureBuffer(tail_size=len(NETCONF_DELIMITER) + 16)
+    while NETCONF_DELIMITER not in buffer.tail:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise TimeoutError(f"NETCONF reply incomplete after {buffer.size} characters")
+        readable, _, _ = select.select([chan], [], [], remaining)
+        if not readable:
+            continue
+        chunk = chan.recv(65535)
+        if not chunk:
+            raise EOFError("NETCONF session closed")
+        stats.bytes_received += len(chunk)
+        buffer.feed(chunk)
+    return buffer.getvalue().rsplit(NETCONF_DELIMITER, 1)[0]
+
+def netconf_config_text(reply):
+    """Config out of an rpc-reply: text elements as is, XML <data> serialized"""
+    root = ET.fromstring(reply.strip())
+    for element in root.iter():
+        tag = element.tag.rsplit('}', 1)[-1]
+        if tag == 'rpc-error':
+            message = ''.join(element.itertext()).strip()
+            raise ConnectionError(f"NETCONF error: {message}")
+        if tag in NETCONF_TEXT_ELEMENTS:
+            return element.text or ''
+    for element in root.iter():
+        if element.tag.rsplit('}', 1)[-1] == 'data':
+            ET.indent(element)
+            return '\n'.join(ET.tostring(child, encoding='unicode') for child in element)
+    raise ConnectionError("NETCONF reply has no configuration")
+
+@capture_strategy('netconf')
+def capture_netconf(session, profile, stats, timeout=120):
+    """<get-config> (or profile.netconf_rpc) over the netconf SSH subsystem, base:1.0 framing"""
+    deadline = time.monotonic() + timeout
+    with stats.phase('commands'):
+        chan = session.open_session()
+        try:
+            chan.invoke_subsystem('netconf')
+            chan.sendall(NETCONF_HELLO.encode())
+            _read_netconf_message(chan, deadline, stats)  # Server hello
+            rpc = profile.netconf_rpc or NETCONF_GET_CONFIG
+            chan.sendall(
+                f'<rpc message-id="1" xmlns="urn:ietf:params:xml:ns:netconf:base:1.0">{rpc}</rpc>{NETCONF_DELIMITER}'.encode()
+            )
+            reply = _read_netconf_message(chan, deadline, stats)
+            chan.sendall(
+                f'<rpc message-id="2" xmlns="urn:ietf:params:xml:ns:netconf:base:1.0"><close-session/></rpc>{NETCONF_DELIMITER}'.encode()
+            )
+        finally:
+            _close(chan)
+    return netconf_config_text(reply)
+
+def capture_config(session, profile, stats, strategies, timeout=120):
+    """
+    Try the strategies in order on one authenticated session, return the raw
+    text of the first that works and record its name in stats.strategy.
+    The last error is raised when all of them fail.
+    """
+    error = None
+    for name in strategies:
+        try:
+            output = CAPTURE_STRATEGIES[name](session, profile, stats, timeout)
+        except Exception as e:
+            error = e
+            logger.info(f"↪️ {name} capture failed: {str(e)}")
+            continue
+        stats.strategy = name
+        # Files and exec output end with a newline, a shell capture ends where the prompt was cut
+        return output.rstrip('\r\n')
+    raise error or CaptureUnsupported("no capture strategy configured")
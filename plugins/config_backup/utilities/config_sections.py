@@ -0,0 +1,165 @@
+import hashlib
+from bisect import bisect_left
+from collections import OrderedDict
+from .diff_utils import diff_opcodes, build_diff_rows
+from .vendors import get_profile, get_vendor_profile
+
+
+class ConfigSection:
+    """A block of config lines: the header line and its body, hashed as a whole"""
+    __slots__ = ('header', 'start', 'lines', 'digest')
+
+    def __init__(self, header, start):
+        self.header = header
+        self.start = start
+        self.lines = []
+        self.digest = None
+
+    def finish(self):
+        self.digest = hashlib.sha1('\n'.join(self.lines).encode()).digest()
+        return self
+
+
+def _is_indented(line):
+    return line[:1] in (' ', '\t')
+
+
+def parse_sections(lines, vendor_key='default'):
+    """
+    Split a config into top-level sections. A section ends at a separator
+    line (kept as its last line), at a header line, or when an unindented
+    line follows an indented block.
+    """
+    profile = get_profile(vendor_key)
+    # Separators are block ends clean_config leaves in place, headers open a block on their own
+    separators = profile.section_separators
+    headers = profile.section_headers
+    sections = []
+    current = None
+    for number, line in enumerate(lines):
+        stripped = line.strip()
+        starts_block = (
+            current is None
+            or (headers and stripped.startswith(headers))
+            or (not _is_indented(line) and current.lines and _is_indented(current.lines[-1]))
+        )
+        if starts_block:
+            current = ConfigSection(line, number)
+            sections.append(current)
+        current.lines.append(line)
+        if stripped in separators:
+            current = None
+    return [section.finish() for section in sections]
+
+
+_parsed = OrderedDict()
+PARSED_CACHE_SIZE = 32
+
+
+def parse_config_sections(digest, text, vendor_key='default'):
+    """Parse a backup once per process; keyed by digest so repeated diffs reuse it"""
+    key = (digest, vendor_key)
+    if digest and key in _parsed:
+        _parsed.move_to_end(key)
+        return _parsed[key]
+    sections = parse_sections(text.strip().splitlines(), vendor_key)
+    if digest:
+        _parsed[key] = sections
+        if len(_parsed) > PARSED_CACHE_SIZE:
+            _parsed.popitem(last=False)
+    return sections
+
+
+def _section_keys(sections):
+    """(header, occurrence) keys so repeated headers still line up in order"""
+    seen = {}
+    keys = []
+    for section in sections:
+        index = seen.get(section.header, 0)
+        seen[section.header] = index + 1
+        keys.append((section.header, index))
+    return keys
+
+
+def _section_rows(old, new, context):
+    """Line diff inside one pair of sections, numbered with absolute line numbers"""
+    if old is None:
+        return build_diff_rows([], new.lines, [('insert', 0, 0, 0, len(new.lines))], context, 0, new.start)
+    if new is None:
+        return build_diff_rows(old.lines, [], [('delete', 0, len(old.lines), 0, 0)], context, old.start, 0)
+    if old.header == new.header:
+        # Keep the header visible so a change deep in a block still shows where it is
+        header = build_diff_rows(old.lines[:1], new.lines[:1], [('equal', 0, 1, 0, 1)], -1, old.start, new.start)
+        body1, body2 = old.lines[1:], new.lines[1:]
+        opcodes = diff_opcodes(body1, body2)
+        return header + build_diff_rows(body1, body2, opcodes, context, old.start + 1, new.start + 1, leading_context=True)
+    return build_diff_rows(old.lines, new.lines, diff_opcodes(old.lines, new.lines), context, old.start, new.start)
+
+
+def diff_sections(old_sections, new_sections, context=3):
+    """
+    Diff two section lists. Sections are matched on their header, identical
+    sections (same digest) are folded without looking at their lines, so
+    moved blocks are not reported as changes.
+    """
+    old_keys = _section_keys(old_sections)
+    new_keys = _section_keys(new_sections)
+    old_by_key = {key: index for index, key in enumerate(old_keys)}
+    matches = [old_by_key.get(key) for key in new_keys]
+    matched_old = {index for index in matches if index is not None}
+    # Old sections with no counterpart, emitted in order as deletions (or paired with renamed blocks)
+    unmatched = [index for index in range(len(old_sections)) if index not in matched_old]
+    next_unmatched = 0
+
+    # Old index of the next matched section after every position, to know where a gap ends
+    next_anchor = [len(old_sections)] * len(new_sections)
+    anchor = len(old_sections)
+    for position in range(len(new_sections) - 1, -1, -1):
+        next_anchor[position] = anchor
+        if matches[position] is not None:
+            anchor = matches[position]
+
+    rows = []
+
+    def fold(count):
+        if rows and rows[-1]['tag'] == 'fold':
+            rows[-1]['count'] += count
+        else:
+            rows.append({"tag": "fold", "count": count, "left": "", "right": "", "left_no": "", "right_no": ""})
+
+    def delete_until(limit):
+        nonlocal next_unmatched
+        while next_unmatched < len(unmatched) and unmatched[next_unmatched] < limit:
+            rows.extend(_section_rows(old_sections[unmatched[next_unmatched]], None, context))
+            next_unmatched += 1
+
+    for position, section in enumerate(new_sections):
+        old_index = matches[position]
+        if old_index is None:
+            # New or renamed block: pair it with the next unmatched old block before the next anchor
+            gap_end = bisect_left(unmatched, next_anchor[position], next_unmatched)
+            if gap_end > next_unmatched:
+                rows.extend(_section_rows(old_sections[unmatched[next_unmatched]], section, context))
+                next_unmatched += 1
+            else:
+                rows.extend(_section_rows(None, section, context))
+            continue
+
+        delete_until(old_index)
+        old = old_sections[old_index]
+        if old.digest == section.digest and context >= 0:
+            fold(len(section.lines))
+        else:
+            rows.extend(_section_rows(old, section, context))
+
+    delete_until(len(old_sections))
+    return rows
+
+
+def diff_configs_by_section(text1, digest1, text2, digest2, vendor='', context=3):
+    vendor_key = get_vendor_profile(vendor).key
+    return diff_sections(
+        parse_config_sections(digest1, text1, vendor_key),
+        parse_config_sections(digest2, text2, vendor_key),
+        context,
+    )
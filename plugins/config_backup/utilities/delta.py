@@ -0,0 +1,33 @@
+import json
+from .diff_utils import diff_opcodes
+
+
+def make_delta(base_text, text):
+    """
+    Ops that rebuild text from base_text: [start, end] copies base lines,
+    a list of strings inserts those lines literally.
+    """
+    base_lines = base_text.split('\n')
+    lines = text.split('\n')
+    ops = []
+    for tag, i1, i2, j1, j2 in diff_opcodes(base_lines, lines):
+        if tag == 'equal':
+            ops.append([i1, i2])
+        elif tag in ('replace', 'insert'):
+            ops.append(lines[j1:j2])
+    return ops
+
+
+def apply_delta(base_text, ops):
+    base_lines = base_text.split('\n')
+    lines = []
+    for op in ops:
+        if op and isinstance(op[0], int):
+            lines.extend(base_lines[op[0]:op[1]])
+        else:
+            lines.extend(op)
+    return '\n'.join(lines)
+
+
+def delta_size(ops):
+    return len(json.dumps(ops, separators=(',', ':')))
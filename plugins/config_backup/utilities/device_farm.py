@@ -0,0 +1,512 @@
+import io
+import random
+import socket
+import threading
+import time
+import logging
+from types import SimpleNamespace
+from xml.sax.saxutils import escape
+import paramiko
+
+logger = logging.getLogger(__name__)
+
+FARM_USERNAME = 'farm'
+FARM_PASSWORD = 'farm'
+
+ANSI_BOLD = '\x1b[1m'
+ANSI_RESET = '\x1b[0m'
+
+# Per vendor: manufacturer name, prompts, commands and paging marker
+VENDORS = {
+    'huawei': {
+        'manufacturer': 'Huawei',
+        'prompt': '<{name}>',
+        'enable_prompt': None,
+        'paging_off': 'screen-length 0 temporary',
+        'show_config': 'display current-configuration',
+        'more': '  ---- More ----',
+        'separator': '#',
+    },
+    'mellanox': {
+        'manufacturer': 'Mellanox',
+        'prompt': '{name} [standalone: master] > ',
+        'enable_prompt': '{name} [standalone: master] # ',
+        'paging_off': 'terminal length 999',
+        'show_config': 'show running-config',
+        'more': 'lines 1-24 (more)',
+        'separator': '',
+    },
+    'cisco': {
+        'manufacturer': 'Cisco',
+        'prompt': '{name}#',
+        'enable_prompt': None,
+        'paging_off': 'terminal length 0',
+        'show_config': 'show running-config',
+        'more': ' --More-- ',
+        'separator': '!',
+    },
+}
+
+FAILURES = ('refuse', 'auth', 'hang', 'drop')
+CAPABILITIES = ('shell', 'exec', 'scp', 'sftp', 'netconf')
+# How an exec channel ends: exit status then EOF; EOF first and the status a moment later
+# (OpenSSH based: Arista, Junos, Dell OS10); status, then the whole connection closed (IOS)
+EXEC_MODES = ('status-first', 'eof-first', 'close')
+NETCONF_DELIMITER = b']]>]]>'
+
+
+def generate_config(vendor, lines=2000, seed=0):
+    """A plausible running config of roughly the given number of lines"""
+    rng = random.Random(seed)
+    separator = VENDORS[vendor]['separator']
+    if vendor == 'mellanox':
+        header = [f'{ANSI_BOLD}## Running database "initial"{ANSI_RESET}', '## Generated at 2024/01/01 00:00:00 +0000', '##']
+    else:
+        header = ['version 1.0', separator]
+    body = []
+    port = 0
+    while len(header) + len(body) < lines:
+        if vendor == 'huawei':
+            body += [f'interface 10GE1/0/{port}', f' description uplink-{rng.randrange(10000)}',
+                     f' port default vlan {rng.randrange(1, 4095)}', separator]
+        elif vendor == 'mellanox':
+            body += [f'   interface ethernet 1/{port} description port-{rng.randrange(10000)}',
+                     f'   interface ethernet 1/{port} switchport access vlan {rng.randrange(1, 4095)}']
+        else:
+            # Descriptions like <to-core> end in a prompt character and must not stop a shell capture
+            description = f'<uplink-{port}>' if port % 10 == 0 else f'access-{rng.randrange(10000)}'
+            body += [f'interface GigabitEthernet1/0/{port}', f' description {description}',
+                     f' switchport access vlan {rng.randrange(1, 4095)}', separator]
+        port += 1
+    return '\n'.join(header + body[:lines - len(header)])
+
+
+def show_output(vendor, config):
+    """The config as the show command prints it"""
+    if vendor == 'cisco':
+        return f'Building configuration...\n\nCurrent configuration : {len(config)} bytes\n{config}\nend'
+    return config
+
+
+class FarmDevice:
+    """
+    One simulated switch. latency is added before every command response,
+    bandwidth (bytes/s, None for unlimited) throttles output, failure_rate is
+    the share of connections that fail with the given failure mode.
+    capabilities limits the channel types it accepts; scp and sftp serve the
+    running config under any path. exec_mode is one of EXEC_MODES.
+    """
+
+    def __init__(self, vendor='cisco', name=None, lines=2000, latency=0.0, bandwidth=None,
+                 failure=None, failure_rate=0.0, page_size=24, seed=0, capabilities=CAPABILITIES,
+                 exec_mode='status-first'):
+        if vendor not in VENDORS:
+            raise ValueError(f"Unknown vendor {vendor}, expected one of {', '.join(VENDORS)}")
+        if failure is not None and failure not in FAILURES:
+            raise ValueError(f"Unknown failure {failure}, expected one of {', '.join(FAILURES)}")
+        if exec_mode not in EXEC_MODES:
+            raise ValueError(f"Unknown exec_mode {exec_mode}, expected one of {', '.join(EXEC_MODES)}")
+        self.vendor = vendor
+        self.name = name or f'{vendor}-{seed}'
+        self.config = generate_config(vendor, lines, seed)
+        # What scp, sftp and netconf return: the show output without terminal formatting
+        self.saved_config = show_output(vendor, self.config).replace(ANSI_BOLD, '').replace(ANSI_RESET, '')
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.failure = failure
+        self.failure_rate = failure_rate
+        self.page_size = page_size
+        self.capabilities = tuple(capabilities)
+        self.exec_mode = exec_mode
+        self.rng = random.Random(seed)
+        self.port = None
+
+    def roll_failure(self):
+        if self.failure and self.rng.random() < self.failure_rate:
+            return self.failure
+        return None
+
+
+class _FarmServer(paramiko.ServerInterface):
+
+    def __init__(self, device, failure):
+        self.device = device
+        self.failure = failure
+        # chanid -> [Event, request]; request is (kind, *arguments), e.g. ('exec', command)
+        self.requests = {}
+
+    def get_allowed_auths(self, username):
+        return 'password'
+
+    def check_auth_password(self, username, password):
+        if self.failure != 'auth' and username == FARM_USERNAME and password == FARM_PASSWORD:
+            return paramiko.AUTH_SUCCESSFUL
+        return paramiko.AUTH_FAILED
+
+    def check_channel_request(self, kind, chanid):
+        if kind == 'session':
+            self.requests[chanid] = [threading.Event(), None]
+            return paramiko.OPEN_SUCCEEDED
+        return paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+    def _start(self, channel, request):
+        entry = self.requests[channel.get_id()]
+        entry[1] = request
+        entry[0].set()
+        return True
+
+    def check_channel_pty_request(self, channel, term, width, height, pixelwidth, pixelheight, modes):
+        return True
+
+    def check_channel_shell_request(self, channel):
+        return self._start(channel, ('shell',))
+
+    def check_channel_exec_request(self, channel, command):
+        command = command.decode(errors='ignore') if isinstance(command, bytes) else command
+        kind = 'scp' if command.startswith('scp ') else 'exec'
+        if kind not in self.device.capabilities:
+            return False
+        return self._start(channel, (kind, command))
+
+    def check_channel_subsystem_request(self, channel, name):
+        if name not in self.device.capabilities:
+            return False
+        if name == 'netconf':
+            return self._start(channel, ('netconf',))
+        # sftp runs in paramiko's own subsystem thread
+        self._start(channel, ('sftp',))
+        return super().check_channel_subsystem_request(channel, name)
+
+
+class _FarmSFTP(paramiko.SFTPServerInterface):
+    """Read-only SFTP: every path is the running config"""
+
+    def __init__(self, server, device, *args, **kwargs):
+        super().__init__(server, *args, **kwargs)
+        self.device = device
+
+    def _attributes(self):
+        attributes = paramiko.SFTPAttributes()
+        attributes.st_size = len(self.device.saved_config.encode())
+        attributes.st_mode = 0o100644
+        return attributes
+
+    def stat(self, path):
+        return self._attributes()
+
+    lstat = stat
+
+    def open(self, path, flags, attr):
+        handle = paramiko.SFTPHandle(flags)
+        handle.readfile = io.BytesIO(self.device.saved_config.encode())
+        handle.stat = self._attributes
+        return handle
+
+
+def _matches(command, known):
+    """CLI-style abbreviations: 'sh run' matches 'show running-config'"""
+    words = command.split()
+    known_words = known.split()
+    return len(words) == len(known_words) and all(
+        full.startswith(word) for word, full in zip(words, known_words)
+    )
+
+
+class _Shell:
+    """The CLI session on one channel"""
+
+    def __init__(self, device, chan, failure):
+        self.device = device
+        self.vendor = VENDORS[device.vendor]
+        self.chan = chan
+        self.failure = failure
+        self.paging = True
+        self.enabled = False
+        self.pending = b''
+
+    def prompt(self):
+        template = self.vendor['enable_prompt'] if self.enabled else self.vendor['prompt']
+        return template.format(name=self.device.name)
+
+    def send(self, text):
+        data = text.replace('\n', '\r\n').encode()
+        if not self.device.bandwidth:
+            self.chan.sendall(data)
+            return
+        for start in range(0, len(data), 4096):
+            self.chan.sendall(data[start:start + 4096])
+            time.sleep(4096 / self.device.bandwidth)
+
+    def read_line(self):
+        line = b''
+        while True:
+            data = self.chan.recv(1)
+            if not data:
+                return None
+            if data in (b'\r', b'\n'):
+                if line:
+                    return line.decode(errors='ignore').strip()
+                continue
+            line += data
+
+    def show_config(self):
+        config = show_output(self.device.vendor, self.device.config)
+        lines = config.split('\n')
+        if self.failure == 'drop':
+            self.send('\n'.join(lines[:len(lines) // 2]))
+            self.chan.close()
+            return False
+        if not self.paging:
+            self.send(config + '\n')
+            return True
+        for start in range(0, len(lines), self.device.page_size):
+            self.send('\n'.join(lines[start:start + self.device.page_size]) + '\n')
+            if start + self.device.page_size < len(lines):
+                self.send(self.vendor['more'])
+                if not self.chan.recv(1):
+                    return False
+                self.send('\r' + ' ' * len(self.vendor['more']) + '\r')
+        return True
+
+    def hang(self):
+        # Authenticates fine, then never answers
+        while self.chan.recv(1024):
+            pass
+
+    def exec(self, command):
+        """Non-interactive command: raw output, exit status, no paging"""
+        if self.failure == 'hang':
+            return self.hang()
+        if self.device.latency:
+            time.sleep(self.device.latency)
+        if not _matches(command, self.vendor['show_config']):
+            self.chan.sendall_stderr(f'% Unrecognized command "{command}"\n'.encode())
+            self.exit(1)
+            return
+        config = show_output(self.device.vendor, self.device.config) + '\n'
+        if self.failure == 'drop':
+            self.chan.sendall(config[:len(config) // 2].encode())
+            return
+        self.chan.sendall(config.encode())
+        self.exit(0)
+
+    def exit(self, status):
+        if self.device.exec_mode == 'eof-first':
+            self.chan.shutdown_write()
+            time.sleep(0.2)
+        self.chan.send_exit_status(status)
+
+    def scp(self, command):
+        """scp -f: the SCP source side, for any path"""
+        if self.failure == 'hang':
+            return self.hang()
+        data = self.device.saved_config.encode()
+        if self.chan.recv(1) != b'\0':
+            return
+        if self.device.latency:
+            time.sleep(self.device.latency)
+        name = command.split()[-1].rsplit('/', 1)[-1]
+        self.chan.sendall(f'C0644 {len(data)} {name}\n'.encode())
+        if self.chan.recv(1) != b'\0':
+            return
+        if self.failure == 'drop':
+            self.chan.sendall(data[:len(data) // 2])
+            return
+        self.chan.sendall(data + b'\0')
+        self.chan.recv(1)
+        self.chan.send_exit_status(0)
+
+    def read_netconf(self):
+        # A client may send its hello and first rpc in one go, so keep whatever follows the delimiter
+        while NETCONF_DELIMITER not in self.pending:
+            data = self.chan.recv(65535)
+            if not data:
+                return None
+            self.pending += data
+        message, self.pending = self.pending.split(NETCONF_DELIMITER, 1)
+        return message.decode(errors='ignore')
+
+    def netconf(self):
+        """base:1.0 NETCONF answering any rpc with the config as text"""
+        if self.failure == 'hang':
+            return self.hang()
+        self.chan.sendall(
+            b'<hello xmlns="urn:ietf:params:xml:ns:netconf:base:1.0"><capabilities>'
+            b'<capability>urn:ietf:params:netconf:base:1.0</capability></capabilities>'
+            b'<session-id>1</session-id></hello>' + NETCONF_DELIMITER
+        )
+        if self.read_netconf() is None:
+            return
+        while True:
+            rpc = self.read_netconf()
+            if rpc is None:
+                return
+            if self.device.latency:
+                time.sleep(self.device.latency)
+            if 'close-session' in rpc:
+                body = '<ok/>'
+            else:
+                body = f'<configuration-text>{escape(self.device.saved_config)}</configuration-text>'
+            reply = f'<rpc-reply xmlns="urn:ietf:params:xml:ns:netconf:base:1.0">{body}</rpc-reply>'.encode()
+            if self.failure == 'drop':
+                self.chan.sendall(reply[:len(reply) // 2])
+                return
+            self.chan.sendall(reply + NETCONF_DELIMITER)
+            if body == '<ok/>':
+                return
+
+    def run(self):
+        if self.failure == 'hang':
+            return self.hang()
+        self.send(f'\nInfo: The max number of VTY users is 10.\n\n{self.prompt()}')
+        while True:
+            command = self.read_line()
+            if command is None:
+                return
+            self.send(command + '\n')  # Echo, like a real terminal
+            if self.device.latency:
+                time.sleep(self.device.latency)
+            if _matches(command, self.vendor['paging_off']):
+                self.paging = False
+            elif command and _matches(command, 'enable') and self.vendor['enable_prompt']:
+                self.enabled = True
+            elif _matches(command, self.vendor['show_config']):
+                if not self.show_config():
+                    return
+            elif command in ('quit', 'exit'):
+                self.chan.close()
+                return
+            elif command:
+                self.send(f'% Unrecognized command "{command}"\n')
+            self.send(self.prompt())
+
+
+class DeviceFarm:
+    """
+    In-process SSH servers that behave like switches, one localhost listener per FarmDevice.
+
+        with DeviceFarm([FarmDevice('huawei', lines=5000, latency=0.05)]) as farm:
+            device = farm.netbox_devices()[0]
+            backup_device_config(device, FARM_USERNAME, FARM_PASSWORD)
+    """
+
+    def __init__(self, devices, host='127.0.0.1'):
+        self.devices = list(devices)
+        self.host = host
+        self.host_key = None
+        self._listeners = []
+        self._transports = []
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def start(self):
+        self.host_key = paramiko.RSAKey.generate(2048)
+        for device in self.devices:
+            listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            listener.bind((self.host, 0))
+            listener.listen(64)
+            device.port = listener.getsockname()[1]
+            self._listeners.append(listener)
+            threading.Thread(target=self._accept, args=(device, listener), daemon=True).start()
+        logger.info(f"🧪 Device farm: {len(self.devices)} devices on {self.host}")
+
+    def stop(self):
+        self._stopped.set()
+        for listener in self._listeners:
+            listener.close()
+        with self._lock:
+            transports, self._transports = self._transports, []
+        for transport in transports:
+            transport.close()
+
+    def _accept(self, device, listener):
+        while not self._stopped.is_set():
+            try:
+                sock, _ = listener.accept()
+            except OSError:
+                return
+            failure = device.roll_failure()
+            if failure == 'refuse':
+                sock.close()
+                continue
+            threading.Thread(target=self._serve, args=(device, sock, failure), daemon=True).start()
+
+    def _serve(self, device, sock, failure):
+        transport = paramiko.Transport(sock)
+        transport.add_server_key(self.host_key)
+        transport.set_subsystem_handler('sftp', paramiko.SFTPServer, _FarmSFTP, device)
+        server = _FarmServer(device, failure)
+        with self._lock:
+            self._transports.append(transport)
+        try:
+            transport.start_server(server=server)
+        except (paramiko.SSHException, EOFError, OSError):
+            return
+        # Pooled clients open a new channel on the same transport for every collection
+        while transport.is_active() and not self._stopped.is_set():
+            chan = transport.accept(timeout=1)
+            if chan is None:
+                continue
+            threading.Thread(target=self._channel, args=(device, chan, server, failure), daemon=True).start()
+
+    def _channel(self, device, chan, server, failure):
+        entry = server.requests[chan.get_id()]
+        if not entry[0].wait(10):
+            chan.close()
+            return
+        kind, arguments = entry[1][0], entry[1][1:]
+        if kind == 'sftp':
+            return  # Served by paramiko's SFTPServer thread
+        shell = _Shell(device, chan, failure)
+        try:
+            # shell -> run(), the others have methods of the same name
+            getattr(shell, 'run' if kind == 'shell' else kind)(*arguments)
+        except (OSError, EOFError, paramiko.SSHException):
+            pass
+        finally:
+            chan.close()
+            if kind == 'exec' and device.exec_mode == 'close':
+                chan.get_transport().close()
+
+    def netbox_devices(self):
+        """Stand-ins with the attributes the collection code reads from dcim Device"""
+        devices = []
+        for index, device in enumerate(self.devices, start=1):
+            ip = SimpleNamespace(address=SimpleNamespace(ip=self.host))
+            manufacturer = SimpleNamespace(pk=device.vendor, name=VENDORS[device.vendor]['manufacturer'])
+            devices.append(SimpleNamespace(
+                pk=index,
+                name=device.name,
+                primary_ip=ip,
+                oob_ip=None,
+                site_id=index,
+                device_type=SimpleNamespace(manufacturer=manufacturer, manufacturer_id=manufacturer.pk),
+                custom_field_data={'ssh_port': device.port},
+            ))
+        return devices
+
+
+def build_farm(count=50, lines=2000, latency=0.02, failure=None, failure_rate=0.0, vendors=tuple(VENDORS),
+               capabilities=CAPABILITIES, exec_mode='status-first'):
+    """A farm of count devices cycling through vendors"""
+    return DeviceFarm([
+        FarmDevice(
+            vendors[index % len(vendors)],
+            lines=lines,
+            latency=latency,
+            failure=failure,
+            failure_rate=failure_rate,
+            seed=index,
+            capabilities=capabilities,
+            exec_mode=exec_mode,
+        )
+        for index in range(count)
+    ])
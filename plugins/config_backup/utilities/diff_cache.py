@@ -0,0 +1,40 @@
+from django.core.cache import cache
+
+# Bump when the rows produced by build_diff_rows() change shape
+DIFF_CACHE_VERSION = 2
+KEY_PREFIX = 'netbox_config_backup:diff'
+
+
+def diff_cache_key(digest1, digest2, variant):
+    # The pair is ordered: old -> new and new -> old are different diffs
+    return f'{KEY_PREFIX}:v{DIFF_CACHE_VERSION}:{digest1}:{digest2}:{variant}'
+
+
+def _count(event):
+    key = f'{KEY_PREFIX}:stats:{event}'
+    cache.add(key, 0, timeout=None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Evicted between add() and incr()
+        cache.set(key, 1, timeout=None)
+
+
+def get_cached_diff(digest1, digest2, variant):
+    if not digest1 or not digest2:
+        return None
+    rows = cache.get(diff_cache_key(digest1, digest2, variant))
+    _count('hits' if rows is not None else 'misses')
+    return rows
+
+
+def set_cached_diff(digest1, digest2, variant, rows, timeout):
+    if digest1 and digest2:
+        cache.set(diff_cache_key(digest1, digest2, variant), rows, timeout=timeout)
+
+
+def get_diff_cache_stats():
+    return {
+        'hits': cache.get(f'{KEY_PREFIX}:stats:hits', 0),
+        'misses': cache.get(f'{KEY_PREFIX}:stats:misses', 0),
+    }
@@ -0,0 +1,186 @@
+import difflib
+from bisect import bisect_left
+
+# Regions without unique anchor lines larger than this are reported as a plain replace
+FALLBACK_LIMIT = 4000000
+
+
+def intern_lines(lines1, lines2):
+    """Map every distinct line to a small int so comparisons are cheap"""
+    table = {}
+    ids1 = [table.setdefault(line, len(table)) for line in lines1]
+    ids2 = [table.setdefault(line, len(table)) for line in lines2]
+    return ids1, ids2
+
+
+def _unique_anchors(a, alo, ahi, b, blo, bhi):
+    """Lines occurring exactly once on both sides, reduced to their longest increasing run"""
+    counts = {}
+    for i in range(alo, ahi):
+        entry = counts.get(a[i])
+        counts[a[i]] = [1, i, None] if entry is None else [entry[0] + 1, i, None]
+    for j in range(blo, bhi):
+        entry = counts.get(b[j])
+        if entry is None:
+            continue
+        entry[2] = j if entry[2] is None else -1
+    pairs = [
+        (i, j) for count, i, j in counts.values()
+        if count == 1 and j is not None and j >= 0
+    ]
+    if not pairs:
+        return []
+    pairs.sort()
+
+    # Longest increasing subsequence on the b side (patience sorting)
+    tails = []
+    tail_index = []
+    previous = [None] * len(pairs)
+    for index, (i, j) in enumerate(pairs):
+        pos = bisect_left(tails, j)
+        if pos == len(tails):
+            tails.append(j)
+            tail_index.append(index)
+        else:
+            tails[pos] = j
+            tail_index[pos] = index
+        previous[index] = tail_index[pos - 1] if pos else None
+    anchors = []
+    index = tail_index[-1]
+    while index is not None:
+        anchors.append(pairs[index])
+        index = previous[index]
+    anchors.reverse()
+    return anchors
+
+
+def _match_region(a, alo, ahi, b, blo, bhi, matches, stack):
+    # Common prefix and suffix
+    while alo < ahi and blo < bhi and a[alo] == b[blo]:
+        matches.append((alo, blo, 1))
+        alo += 1
+        blo += 1
+    while alo < ahi and blo < bhi and a[ahi - 1] == b[bhi - 1]:
+        ahi -= 1
+        bhi -= 1
+        matches.append((ahi, bhi, 1))
+    if alo == ahi or blo == bhi:
+        return
+
+    anchors = _unique_anchors(a, alo, ahi, b, blo, bhi)
+    if anchors:
+        for i, j in anchors:
+            stack.append((alo, i, blo, j))
+            matches.append((i, j, 1))
+            alo, blo = i + 1, j + 1
+        stack.append((alo, ahi, blo, bhi))
+    elif (ahi - alo) * (bhi - blo) <= FALLBACK_LIMIT:
+        # Only repeated lines left (e.g. '!' or '#'), small enough for difflib
+        matcher = difflib.SequenceMatcher(None, a[alo:ahi], b[blo:bhi], autojunk=False)
+        for i, j, size in matcher.get_matching_blocks():
+            if size:
+                matches.append((alo + i, blo + j, size))
+
+
+def _opcodes_from_matches(len1, len2, matches):
+    matches.sort()
+    blocks = []
+    for i, j, size in matches:
+        if blocks and blocks[-1][0] + blocks[-1][2] == i and blocks[-1][1] + blocks[-1][2] == j:
+            blocks[-1][2] += size
+        else:
+            blocks.append([i, j, size])
+    blocks.append([len1, len2, 0])
+
+    opcodes = []
+    i = j = 0
+    for ai, bj, size in blocks:
+        tag = ''
+        if i < ai and j < bj:
+            tag = 'replace'
+        elif i < ai:
+            tag = 'delete'
+        elif j < bj:
+            tag = 'insert'
+        if tag:
+            opcodes.append((tag, i, ai, j, bj))
+        i, j = ai + size, bj + size
+        if size:
+            opcodes.append(('equal', ai, i, bj, j))
+    return opcodes
+
+
+def diff_opcodes(lines1, lines2):
+    """
+    Patience diff over interned lines. Returns opcodes in the same format as
+    difflib.SequenceMatcher.get_opcodes().
+    """
+    a, b = intern_lines(lines1, lines2)
+    matches = []
+    stack = [(0, len(a), 0, len(b))]
+    while stack:
+        alo, ahi, blo, bhi = stack.pop()
+        _match_region(a, alo, ahi, b, blo, bhi, matches, stack)
+    return _opcodes_from_matches(len(a), len(b), matches)
+
+
+def line_changes(text1, text2):
+    """(added, removed) line counts from text1 to text2"""
+    added = removed = 0
+    for tag, i1, i2, j1, j2 in diff_opcodes(text1.split('\n'), text2.split('\n')):
+        if tag != 'equal':
+            added += j2 - j1
+            removed += i2 - i1
+    return added, removed
+
+
+def _changed_rows(lines1, lines2, tag, i1, i2, j1, j2, left_start, right_start):
+    rows = []
+    for idx in range(max(i2 - i1, j2 - j1)):
+        left = i1 + idx < i2
+        right = j1 + idx < j2
+        rows.append({
+            "left": lines1[i1 + idx] if left else "",
+            "right": lines2[j1 + idx] if right else "",
+            "tag": tag,
+            "left_no": left_start + i1 + idx + 1 if left else "",
+            "right_no": right_start + j1 + idx + 1 if right else "",
+        })
+    return rows
+
+
+def _equal_rows(lines1, i1, i2, j1, left_start, right_start):
+    return [{
+        "left": lines1[i],
+        "right": lines1[i],
+        "tag": "equal",
+        "left_no": left_start + i + 1,
+        "right_no": right_start + j1 + (i - i1) + 1,
+    } for i in range(i1, i2)]
+
+
+def _fold_row(count):
+    return {"tag": "fold", "count": count, "left": "", "right": "", "left_no": "", "right_no": ""}
+
+
+def build_diff_rows(lines1, lines2, opcodes, context=3, left_start=0, right_start=0, leading_context=False):
+    """
+    Side-by-side rows for the template. Unchanged regions longer than the
+    context are collapsed into a single 'fold' row. A negative context keeps everything.
+    left_start/right_start offset the line numbers when diffing part of a file.
+    """
+    rows = []
+    last = len(opcodes) - 1
+    for index, (tag, i1, i2, j1, j2) in enumerate(opcodes):
+        if tag != 'equal':
+            rows.extend(_changed_rows(lines1, lines2, tag, i1, i2, j1, j2, left_start, right_start))
+            continue
+        head = 0 if index == 0 and not leading_context else context
+        tail = 0 if index == last else context
+        if context < 0 or i2 - i1 <= head + tail:
+            rows.extend(_equal_rows(lines1, i1, i2, j1, left_start, right_start))
+            continue
+        rows.extend(_equal_rows(lines1, i1, i1 + head, j1, left_start, right_start))
+        rows.append(_fold_row(i2 - i1 - head - tail))
+        rows.extend(_equal_rows(lines1, i2 - tail, i2, j2 - tail, left_start, right_start))
+    return rows
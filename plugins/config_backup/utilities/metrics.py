@@ -0,0 +1,108 @@
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# Phases of one device collection, in order
+PHASES = ('connect', 'auth', 'shell', 'commands', 'prompt_wait', 'clean', 'total')
+
+SECONDS_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+BYTES_BUCKETS = tuple(1024 * 4 ** power for power in range(8))  # 1 KiB .. 16 MiB
+
+
+class CollectionStats:
+    """
+    Timings of one device collection. 'connect' is the TCP handshake, 'auth'
+    the SSH key exchange and login, 'commands' everything sent on the shell,
+    'prompt_wait' the part of it spent blocked waiting for device output.
+    """
+
+    def __init__(self):
+        self.phases = {}
+        self.bytes_received = 0
+        # Capture strategy that produced the config
+        self.strategy = ''
+
+    def add(self, name, seconds):
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    @contextmanager
+    def phase(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - started)
+
+    def as_dict(self):
+        return {
+            'phases': {name: round(value, 4) for name, value in self.phases.items()},
+            'bytes': self.bytes_received,
+            'strategy': self.strategy,
+        }
+
+
+class Histogram:
+    """Prometheus-style histogram (per-bucket counts, sum, count) that fits in a JSONField"""
+
+    def __init__(self, buckets, counts=None, total=0.0, count=0):
+        self.buckets = tuple(buckets)
+        self.counts = list(counts) if counts else [0] * (len(self.buckets) + 1)
+        self.sum = total
+        self.count = count
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def merge(self, other):
+        for index, value in enumerate(other.counts):
+            self.counts[index] += value
+        self.sum += other.sum
+        self.count += other.count
+
+    def cumulative(self):
+        """[(upper bound, cumulative count)] ending with +Inf, as prometheus_client expects"""
+        result = []
+        running = 0
+        for bound, value in zip(self.buckets + (float('inf'),), self.counts):
+            running += value
+            result.append(('+Inf' if bound == float('inf') else str(bound), running))
+        return result
+
+    def as_dict(self):
+        return {'counts': self.counts, 'sum': round(self.sum, 4), 'count': self.count}
+
+    @classmethod
+    def from_dict(cls, buckets, data):
+        if not data or len(data.get('counts', ())) != len(buckets) + 1:
+            return cls(buckets)
+        return cls(buckets, data['counts'], data['sum'], data['count'])
+
+
+class RunTimings:
+    """Per-phase and bytes histograms of a whole run, stored on CollectionRun.timings"""
+
+    def __init__(self, data=None):
+        data = data or {}
+        phases = data.get('phases', {})
+        self.phases = {name: Histogram.from_dict(SECONDS_BUCKETS, phases.get(name)) for name in PHASES}
+        self.bytes = Histogram.from_dict(BYTES_BUCKETS, data.get('bytes'))
+
+    def record(self, stats):
+        for name, seconds in stats.phases.items():
+            if name in self.phases:
+                self.phases[name].observe(seconds)
+        if stats.phases:
+            self.bytes.observe(stats.bytes_received)
+
+    def merge(self, other):
+        for name, histogram in other.phases.items():
+            self.phases[name].merge(histogram)
+        self.bytes.merge(other.bytes)
+
+    def as_dict(self):
+        return {
+            'phases': {name: histogram.as_dict() for name, histogram in self.phases.items() if histogram.count},
+            'bytes': self.bytes.as_dict(),
+        }
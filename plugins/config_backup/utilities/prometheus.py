@@ -0,0 +1,86 @@
+from prometheus_client import CollectorRegistry, generate_latest
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily, HistogramMetricFamily
+from .diff_cache import get_diff_cache_stats
+from .metrics import RunTimings
+
+# CollectionTotals.pool counters, see utilities.ssh_pool.POOL_COUNTERS
+POOL_METRICS = {
+    'connects': ('ssh_connects', 'SSH connections opened by collections'),
+    'connect_seconds': ('ssh_connect_seconds', 'Time spent opening SSH connections (TCP, key exchange and login)'),
+    'connect_failures': ('ssh_connect_failures', 'SSH connections that could not be opened'),
+    'reuses': ('ssh_session_reuses', 'Collections that reused a pooled SSH session'),
+    'health_check_failures': ('ssh_health_check_failures', 'Pooled SSH sessions found dead when taken from the pool'),
+}
+
+PREFIX = 'netbox_config_backup'
+
+
+class ConfigBackupCollector:
+    """
+    Exposes the running totals stored in CollectionTotals. Collections run in cron or RQ
+    worker processes, so the database is the only place the web process can read them from.
+    """
+
+    def collect(self):
+        from ..models import CollectionRun, CollectionTotals
+
+        # One row per run source, however many runs there were
+        totals = list(CollectionTotals.objects.all())
+
+        phases = HistogramMetricFamily(
+            f'{PREFIX}_collection_phase_seconds',
+            'Time spent per device in each collection phase',
+            labels=['source', 'phase'],
+        )
+        received = HistogramMetricFamily(
+            f'{PREFIX}_collection_received_bytes',
+            'Bytes received from a device per collection',
+            labels=['source'],
+        )
+        devices = CounterMetricFamily(
+            f'{PREFIX}_collections',
+            'Device collections by run source (schedule, api) and outcome',
+            labels=['source', 'outcome'],
+        )
+        pool = {
+            name: CounterMetricFamily(f'{PREFIX}_{metric}', documentation, labels=['source'])
+            for name, (metric, documentation) in POOL_METRICS.items()
+        }
+        for row in totals:
+            timings = RunTimings(row.timings)
+            for name, histogram in timings.phases.items():
+                phases.add_metric([row.source, name], histogram.cumulative(), histogram.sum)
+            received.add_metric([row.source], timings.bytes.cumulative(), timings.bytes.sum)
+            for outcome in ('saved', 'unchanged', 'failed'):
+                devices.add_metric([row.source, outcome], getattr(row, outcome))
+            for name, family in pool.items():
+                family.add_metric([row.source], row.pool.get(name, 0))
+        yield phases
+        yield received
+        yield devices
+        yield from pool.values()
+
+        last = CollectionRun.objects.filter(source='schedule', finished__isnull=False).values_list(
+            'created', 'finished'
+        ).first()
+        duration = GaugeMetricFamily(
+            f'{PREFIX}_last_run_seconds',
+            'Wall-clock duration of the most recent finished scheduled collection run',
+        )
+        duration.add_metric([], (last[1] - last[0]).total_seconds() if last else 0)
+        yield duration
+
+        cache = CounterMetricFamily(
+            f'{PREFIX}_diff_cache_lookups',
+            'Compare page diff cache lookups',
+            labels=['result'],
+        )
+        for result, value in get_diff_cache_stats().items():
+            cache.add_metric([result], value)
+        yield cache
+
+
+def render_metrics():
+    registry = CollectorRegistry(auto_describe=False)
+    registry.register(ConfigBackupCollector())
+    return generate_latest(registry)
@@ -0,0 +1,83 @@
+from datetime import timedelta
+from django.db import connection, transaction
+from django.utils.timezone import now
+from dcim.models import Device
+from ..models import ConfigBackup, ConfigBlob
+
+# Every backup is ranked inside its device (newest first) and inside its
+# day/week/month bucket in one pass over the table.
+RETENTION_SQL = """
+SELECT ranked.id, ranked.device_id, device.name
+FROM (
+    SELECT
+        id, device_id, created,
+        ROW_NUMBER() OVER (PARTITION BY device_id ORDER BY created DESC) AS row_number,
+        COUNT(*) OVER (PARTITION BY device_id) AS total,
+        ROW_NUMBER() OVER (PARTITION BY device_id, date_trunc('day', created) ORDER BY created DESC) AS day_row,
+        DENSE_RANK() OVER (PARTITION BY device_id ORDER BY date_trunc('day', created) DESC) AS day_rank,
+        ROW_NUMBER() OVER (PARTITION BY device_id, date_trunc('week', created) ORDER BY created DESC) AS week_row,
+        DENSE_RANK() OVER (PARTITION BY device_id ORDER BY date_trunc('week', created) DESC) AS week_rank,
+        ROW_NUMBER() OVER (PARTITION BY device_id, date_trunc('month', created) ORDER BY created DESC) AS month_row,
+        DENSE_RANK() OVER (PARTITION BY device_id ORDER BY date_trunc('month', created) DESC) AS month_rank
+    FROM {backup_table}
+) ranked
+JOIN {device_table} device ON device.id = ranked.device_id
+WHERE ranked.total > %(threshold)s
+  AND ranked.row_number > %(keep)s
+  AND NOT (ranked.day_row = 1 AND ranked.day_rank <= %(daily)s)
+  AND NOT (ranked.week_row = 1 AND ranked.week_rank <= %(weekly)s)
+  AND NOT (ranked.month_row = 1 AND ranked.month_rank <= %(monthly)s)
+  AND ranked.created < %(cutoff)s
+ORDER BY ranked.device_id, ranked.created
+"""
+
+
+def find_expired_backups(keep=3, threshold=15, max_age_days=None, daily=0, weekly=0, monthly=0):
+    """
+    Backups to delete as [(backup_id, device_id, device_name)].
+
+    Only devices with more than threshold backups are considered. A backup is
+    kept if it is one of the newest keep, the newest of one of the last
+    daily/weekly/monthly buckets, or younger than max_age_days.
+    The newest backup of a device is never returned.
+    """
+    sql = RETENTION_SQL.format(
+        backup_table=connection.ops.quote_name(ConfigBackup._meta.db_table),
+        device_table=connection.ops.quote_name(Device._meta.db_table),
+    )
+    params = {
+        'threshold': threshold,
+        # The newest row drives the auto-collection status
+        'keep': max(keep, 1),
+        'daily': daily,
+        'weekly': weekly,
+        'monthly': monthly,
+        'cutoff': now() - timedelta(days=max_age_days) if max_age_days else now(),
+    }
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.fetchall()
+
+
+def delete_backups(backup_ids, batch_size=1000):
+    deleted = 0
+    for start in range(0, len(backup_ids), batch_size):
+        with transaction.atomic():
+            count, _ = ConfigBackup.objects.filter(pk__in=backup_ids[start:start + batch_size]).delete()
+        deleted += count
+    return deleted
+
+
+def delete_orphan_blobs(batch_size=1000):
+    """
+    Remove blobs no backup points at anymore. Blobs other deltas are built on
+    are kept until those are gone, each pass frees the next link of a chain.
+    """
+    deleted = 0
+    orphans = ConfigBlob.objects.filter(backups__isnull=True, delta_children__isnull=True)
+    while True:
+        batch = list(orphans.values_list('pk', flat=True)[:batch_size])
+        if not batch:
+            return deleted
+        count, _ = orphans.filter(pk__in=batch).delete()
+        deleted += count
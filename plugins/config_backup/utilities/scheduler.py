@@ -0,0 +1,38 @@
+import random
+from datetime import timedelta
+from netbox.plugins import get_plugin_config
+
+PLUGIN_NAME = 'netbox_config_backup'
+
+
+def get_schedule_settings():
+    return {
+        key: get_plugin_config(PLUGIN_NAME, f'schedule_{key}')
+        for key in ('interval', 'min_interval', 'max_interval', 'speedup', 'slowdown', 'retry', 'retry_max', 'jitter')
+    }
+
+
+def next_schedule(outcome, interval, failures, settings, rng=random):
+    """
+    Returns (interval, failures, delay) in seconds after a collection.
+
+    A changed config shortens the device's interval, an unchanged one stretches
+    it, both within min/max. Failures leave the interval alone and back off
+    exponentially from 'retry' up to 'retry_max'. The delay is jittered.
+    """
+    interval = interval or settings['interval']
+    if outcome == 'failed':
+        failures += 1
+        delay = min(settings['retry_max'], settings['retry'] * 2 ** (failures - 1))
+    else:
+        failures = 0
+        factor = settings['speedup'] if outcome == 'saved' else settings['slowdown']
+        interval = int(min(settings['max_interval'], max(settings['min_interval'], interval * factor)))
+        delay = interval
+    jitter = settings['jitter']
+    delay = delay * (1 + rng.uniform(-jitter, jitter))
+    return interval, failures, delay
+
+
+def get_next_due(started, delay):
+    return started + timedelta(seconds=delay)
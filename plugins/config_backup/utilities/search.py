@@ -0,0 +1,50 @@
+import re
+from ..models import DeviceBackupState
+
+# Devices returned by default and at most (?limit=)
+SEARCH_LIMIT = 200
+SEARCH_MAX_LIMIT = 1000
+
+
+def _line_matcher(query, regex):
+    if regex:
+        pattern = re.compile(query, re.IGNORECASE)
+        return lambda line: pattern.search(line) is not None
+    needle = query.lower()
+    return lambda line: needle in line.lower()
+
+
+def search_latest_configs(query, regex=False, limit=SEARCH_LIMIT, max_lines=20):
+    """
+    Find devices whose latest backup contains query (substring or regex, case-insensitive).
+
+    The candidate devices come from the trigram index on ConfigBlob.text, only
+    their texts are scanned in Python for line numbers.
+    Returns (results, truncated): a list of dicts with device, backup_id, created and
+    matches [(line_no, line)], and whether more than limit devices matched.
+    """
+    # Both compile to operators the trigram index serves (icontains would not, see ILike)
+    lookup = 'latest__blob__text__iregex' if regex else 'latest__blob__text__ilike'
+    states = DeviceBackupState.objects.filter(**{lookup: query}).select_related(
+        'device', 'latest__blob'
+    ).order_by('device__name')[:limit + 1]
+    # One row past the limit tells whether there are more, its text isn't scanned
+    states = list(states)
+    truncated = len(states) > limit
+
+    matches_line = _line_matcher(query, regex)
+    results = []
+    for state in states[:limit]:
+        matches = []
+        for number, line in enumerate(state.latest.blob.get_text().splitlines(), start=1):
+            if matches_line(line):
+                matches.append((number, line))
+                if len(matches) >= max_lines:
+                    break
+        results.append({
+            'device': state.device,
+            'backup_id': state.latest_id,
+            'created': state.latest.created,
+            'matches': matches,
+        })
+    return results, truncated
@@ -0,0 +1,262 @@
+import os
+import paramiko
+import socket
+import threading
+import time
+import logging
+from collections import Counter
+from contextlib import contextmanager
+from netbox.plugins import get_plugin_config
+
+logger = logging.getLogger(__name__)
+
+PLUGIN_NAME = 'netbox_config_backup'
+
+# Cumulative pool counters stored in CollectionTotals.pool and exported as metrics
+POOL_COUNTERS = ('connects', 'connect_seconds', 'connect_failures', 'reuses', 'health_check_failures')
+
+
+class SSHSession:
+    """An authenticated client leased from the pool"""
+
+    def __init__(self, pool, key, client, reused, connect):
+        self.pool = pool
+        self.key = key
+        self.client = client
+        self.reused = reused
+        self._connect = connect
+
+    def _open(self, opener):
+        if not self.pool.is_active(self.client):
+            # IOS closes the connection after an exec channel, the next strategy needs a new one
+            self._reconnect('closed')
+            return opener(self.client)
+        try:
+            return opener(self.client)
+        except (paramiko.SSHException, EOFError, OSError) as e:
+            # A refused channel on a live fresh connection is the device's answer; a write
+            # that hit a closed socket shows up before paramiko marks the transport inactive
+            closed = isinstance(e, (EOFError, OSError)) or not self.pool.is_active(self.client)
+            if not self.reused and not closed:
+                raise
+            # Some devices refuse a second channel on an old transport or close it right after the
+            # first one; start over once
+            self._reconnect('stale' if self.reused else 'closed')
+            return opener(self.client)
+
+    def _reconnect(self, reason):
+        logger.info(f"♻️ SSH session to {self.key[0]} {reason}, reconnecting")
+        self.pool.count(reason)
+        self.pool.close_client(self.client)
+        self.client = self._connect()
+        self.reused = False
+
+    def invoke_shell(self):
+        return self._open(lambda client: client.invoke_shell())
+
+    def open_session(self):
+        """A bare channel for exec_command or invoke_subsystem"""
+        return self._open(lambda client: client.get_transport().open_session())
+
+    def open_sftp(self):
+        return self._open(lambda client: client.open_sftp())
+
+
+class SSHSessionPool:
+    """
+    Keeps authenticated paramiko clients per device so that repeated
+    collections skip the key exchange and TACACS authentication.
+
+    The pool lives in one process: collections in the same cron run, web
+    process or non-forking RQ worker (SimpleWorker) share it. The default RQ
+    worker runs every job in a fresh fork, so nothing is reused between jobs.
+    """
+
+    def __init__(self, idle_timeout=60, max_idle_per_device=1):
+        self.idle_timeout = idle_timeout
+        self.max_idle_per_device = max_idle_per_device
+        self.metrics = Counter()
+        self._idle = {}
+        self._lock = threading.Lock()
+        self._reaper = None
+
+    def count(self, name, value=1):
+        with self._lock:
+            self.metrics[name] += value
+
+    def _connect(self, ip, port, username, password, timeout, stats=None, **kwargs):
+        started = time.monotonic()
+        client = paramiko.SSHClient()
+        client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        sock = None
+        try:
+            # TCP handshake on its own so it can be told apart from key exchange and login
+            sock = socket.create_connection((ip, port), timeout=timeout)
+            connected = time.monotonic()
+            if stats is not None:
+                stats.add('connect', connected - started)
+            client.connect(ip, port=port, username=username, password=password, timeout=timeout, sock=sock, **kwargs)
+        except Exception:
+            self.count('connect_failures')
+            client.close()
+            if sock is not None:
+                sock.close()
+            raise
+        if stats is not None:
+            stats.add('auth', time.monotonic() - connected)
+        self.count('connects')
+        self.count('connect_seconds', time.monotonic() - started)
+        return client
+
+    @staticmethod
+    def is_active(client):
+        transport = client.get_transport()
+        return transport is not None and transport.is_active()
+
+    @classmethod
+    def is_healthy(cls, client):
+        if not cls.is_active(client):
+            return False
+        transport = client.get_transport()
+        try:
+            transport.send_ignore()
+        except Exception:
+            return False
+        return True
+
+    @staticmethod
+    def close_client(client):
+        try:
+            client.close()
+        except Exception:
+            pass
+
+    def _expire(self, now):
+        expired = []
+        for key, entries in list(self._idle.items()):
+            fresh = [(client, used) for client, used in entries if now - used < self.idle_timeout]
+            expired.extend(client for client, used in entries if now - used >= self.idle_timeout)
+            if fresh:
+                self._idle[key] = fresh
+            else:
+                del self._idle[key]
+        self.metrics['expired'] += len(expired)  # Called with the lock held
+        return expired
+
+    def _checkout(self, key):
+        with self._lock:
+            expired = self._expire(time.monotonic())
+            entries = self._idle.get(key)
+            client = entries.pop()[0] if entries else None
+        for stale in expired:
+            self.close_client(stale)
+        if client is not None and not self.is_healthy(client):
+            self.count('health_check_failures')
+            self.close_client(client)
+            client = None
+        return client
+
+    def _checkin(self, key, client):
+        with self._lock:
+            expired = self._expire(time.monotonic())
+            entries = self._idle.setdefault(key, [])
+            if len(entries) < self.max_idle_per_device and self.idle_timeout > 0:
+                entries.append((client, time.monotonic()))
+                self._start_reaper()
+            else:
+                expired.append(client)
+        for stale in expired:
+            self.close_client(stale)
+
+    def _start_reaper(self):
+        # Called with the lock held
+        if self._reaper is None:
+            self._reaper = threading.Thread(target=self._reap, name='ssh-pool-reaper', daemon=True)
+            self._reaper.start()
+
+    def _reap(self):
+        """Close idle clients as they expire, even when no collection comes along; stops once the pool is empty"""
+        interval = max(1.0, self.idle_timeout / 2)
+        while True:
+            time.sleep(interval)
+            with self._lock:
+                expired = self._expire(time.monotonic())
+                done = not self._idle
+                if done:
+                    self._reaper = None
+            for client in expired:
+                self.close_client(client)
+            if done:
+                return
+
+    @contextmanager
+    def session(self, ip, username, password, port=22, timeout=15, stats=None, **kwargs):
+        key = (ip, port, username)
+
+        def connect():
+            return self._connect(ip, port, username, password, timeout, stats, **kwargs)
+
+        client = self._checkout(key)
+        if client is not None:
+            self.count('reuses')
+            session = SSHSession(self, key, client, True, connect)
+        else:
+            session = SSHSession(self, key, connect(), False, connect)
+        try:
+            yield session
+        except Exception:
+            self.close_client(session.client)
+            raise
+        if self.is_active(session.client):
+            self._checkin(key, session.client)
+        else:
+            self.close_client(session.client)
+
+    def close_all(self):
+        with self._lock:
+            clients = [client for entries in self._idle.values() for client, used in entries]
+            self._idle.clear()
+        for client in clients:
+            self.close_client(client)
+
+    def counters(self):
+        """Snapshot of POOL_COUNTERS, to pass to counters_since() later"""
+        with self._lock:
+            return {name: self.metrics[name] for name in POOL_COUNTERS}
+
+    def counters_since(self, snapshot):
+        """POOL_COUNTERS added since snapshot, by every thread using the pool"""
+        current = self.counters()
+        return {name: current[name] - snapshot[name] for name in POOL_COUNTERS if current[name] != snapshot[name]}
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.metrics)
+            stats['idle'] = sum(len(entries) for entries in self._idle.values())
+        return stats
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _forget_pool():
+    # A forked child shares the parent's sockets and has none of its transport threads:
+    # drop the inherited clients without closing them, the parent still owns them
+    global _pool, _pool_lock
+    _pool = None
+    _pool_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_forget_pool)
+
+
+def get_ssh_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = SSHSessionPool(
+                idle_timeout=get_plugin_config(PLUGIN_NAME, 'ssh_pool_idle_timeout'),
+                max_idle_per_device=get_plugin_config(PLUGIN_NAME, 'ssh_pool_max_idle_per_device'),
+            )
+    return _pool
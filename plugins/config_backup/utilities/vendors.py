@@ -0,0 +1,165 @@
+import re
+from netbox.plugins import get_plugin_config
+
+PLUGIN_NAME = 'netbox_config_backup'
+
+ANSI_ESCAPE = re.compile(r'\x1B(?:[@-Z\\-_]|\[[0-?]*[ -/]*[@-~])')
+DEFAULT_PROMPT = r'[>#]\s*$'
+
+
+class VendorProfile:
+    """
+    Everything vendor specific about collecting and cleaning a config.
+
+    match: substrings of the lowercased manufacturer name that select this profile
+    prompt: regex matched against the last line of output
+    setup_commands: sent one by one before config_command (paging off, enable...)
+    skip_prefixes: cleaned lines starting with any of these are dropped (command echoes, timestamps)
+    blank_line: what an empty line becomes, None drops it
+    section_separators / section_headers: block structure used by the section diff
+    capture_strategies: capture methods to try in order (see capture.CAPTURE_STRATEGIES),
+    with exec_command, scp_path, sftp_path and netconf_rpc as their settings
+    """
+
+    def __init__(self, key, match=(), prompt=DEFAULT_PROMPT, setup_commands=('terminal length 0',),
+                 config_command='show running-config', skip_prefixes=(), blank_line=None,
+                 section_separators=(), section_headers=(), capture_strategies=('shell',),
+                 exec_command=None, scp_path=None, sftp_path=None, netconf_rpc=None):
+        self.key = key
+        self.match = tuple(match)
+        self.prompt = re.compile(prompt)
+        self.setup_commands = tuple(setup_commands)
+        self.config_command = config_command
+        self.skip_prefixes = tuple(skip_prefixes)
+        self.blank_line = blank_line
+        self.section_separators = tuple(section_separators)
+        self.section_headers = tuple(section_headers)
+        self.capture_strategies = tuple(capture_strategies)
+        self.exec_command = exec_command
+        self.scp_path = scp_path
+        self.sftp_path = sftp_path
+        self.netconf_rpc = netconf_rpc
+        # All prefixes folded into one anchored alternation, longest first
+        if self.skip_prefixes:
+            alternatives = sorted(self.skip_prefixes, key=len, reverse=True)
+            self._skip = re.compile('|'.join(re.escape(prefix) for prefix in alternatives)).match
+        else:
+            self._skip = None
+
+    def __repr__(self):
+        return f'<VendorProfile {self.key}>'
+
+    def capture_order(self, cached=''):
+        """Strategies to try, the one that last worked for the device first"""
+        if cached in self.capture_strategies:
+            return (cached,) + tuple(name for name in self.capture_strategies if name != cached)
+        return self.capture_strategies
+
+    def clean_lines(self, lines):
+        """One pass over raw output lines, yielding the cleaned ones"""
+        skip = self._skip
+        blank_line = self.blank_line
+        ansi_sub = ANSI_ESCAPE.sub
+        for line in lines:
+            if '\x1b' in line:
+                line = ansi_sub('', line)
+            if '\x00' in line:
+                line = line.replace('\x00', '')
+            stripped = line.strip()
+            if not stripped:
+                if blank_line is not None:
+                    yield blank_line
+                continue
+            if skip is not None and skip(stripped):
+                continue
+            yield stripped
+
+    def clean(self, config):
+        return '\n'.join(self.clean_lines(config.split('\n')))
+
+
+_profiles = {}
+_default = VendorProfile('default', section_separators=('!',))
+
+
+def register_vendor(profile):
+    """Add or replace a vendor profile; profiles registered later win on overlapping matches"""
+    _profiles.pop(profile.key, None)
+    _profiles[profile.key] = profile
+    return profile
+
+
+def get_vendor_profile(vendor):
+    """Profile for a manufacturer name (any case), the generic one if nothing matches"""
+    vendor = vendor.lower()
+    for profile in reversed(_profiles.values()):
+        if any(part in vendor for part in profile.match):
+            return profile
+    return _default
+
+
+def get_profile(key):
+    return _profiles.get(key, _default)
+
+
+def register_vendors_from_settings():
+    """Extra profiles from the vendor_profiles setting: a list of VendorProfile keyword dicts"""
+    for options in get_plugin_config(PLUGIN_NAME, 'vendor_profiles') or ():
+        register_vendor(VendorProfile(**options))
+
+
+register_vendor(VendorProfile(
+    'cisco',
+    match=('cisco',),
+    skip_prefixes=(
+        '! Last configuration change', '!Time:',
+        'show', 'terminal', 'Building configuration', 'Current configuration',
+    ),
+    blank_line='!',
+    section_separators=('!',),
+    # scp needs "ip scp server enable", so it is opt-in via vendor_profiles
+    capture_strategies=('exec', 'shell'),
+))
+register_vendor(VendorProfile(
+    'huawei',
+    match=('huawei',),
+    prompt=r'<.*>\s*$',
+    setup_commands=('screen-length 0 temporary',),
+    config_command='display current-configuration',
+    skip_prefixes=('display', 'screen-length', '<'),
+    section_separators=('#',),
+))
+register_vendor(VendorProfile(
+    'mellanox',
+    match=('mellanox', 'depo'),
+    setup_commands=('enable', 'terminal length 999'),
+    skip_prefixes=('## Generated', 'show running-config'),
+    section_headers=('##',),
+))
+register_vendor(VendorProfile(
+    'arista',
+    match=('arista',),
+    skip_prefixes=('! Command:', '! device:', '! boot system', 'show', 'terminal'),
+    section_separators=('!',),
+    capture_strategies=('exec', 'shell'),
+))
+register_vendor(VendorProfile(
+    'juniper',
+    match=('juniper',),
+    prompt=r'[>#%]\s*$',
+    setup_commands=('set cli screen-length 0',),
+    config_command='show configuration | display set | no-more',
+    skip_prefixes=('show configuration', 'set cli', 'Screen length set', '{master', '{backup', '[edit]'),
+    # Same "set" lines as the CLI command, so switching strategy doesn't show up as a change
+    capture_strategies=('netconf', 'exec', 'shell'),
+    exec_command='show configuration | display set',
+    netconf_rpc='<get-configuration format="set"/>',
+))
+register_vendor(VendorProfile(
+    'dell',
+    match=('dell', 'force10'),
+    config_command='show running-configuration',
+    skip_prefixes=('! Version', '! Last configuration change', '! Startup-config last updated', 'show', 'terminal'),
+    section_separators=('!',),
+    capture_strategies=('exec', 'shell'),
+))
@@ -1,8 +1,8 @@
-import paramiko
-import hashlib
 import time
+from .models import config_digest
+from .utilities.ssh_pool import get_ssh_pool
 
-def get_device_config(ip, username, password, vendor):
+def get_device_config(ip, username, password, vendor, port=22):
     commands = {
         'huawei': ['screen-length 0 temporary', 'display current-configuration'],
         'mellanox': ['en', 'terminal length 999', 'show run'],
@@ -12,23 +12,21 @@ def get_device_config(ip, username, password, vendor):
     vendor_key = 'huawei' if 'hua' in vendor.lower() else 'mellanox' if 'mellanox' in vendor.lower() else 'default'
     cmd_set = commands[vendor_key]
 
-    client = paramiko.SSHClient()
-    client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-    client.connect(ip, username=username, password=password, look_for_keys=False, allow_agent=False)
+    with get_ssh_pool().session(ip, username, password, port=port, look_for_keys=False, allow_agent=False) as session:
+        shell = session.invoke_shell()
+        time.sleep(1)
+        shell.recv(1000)
 
-    shell = client.invoke_shell()
-    time.sleep(1)
-    shell.recv(1000)
+        output = ""
+        for cmd in cmd_set:
+            shell.send(cmd + "\n")
+            time.sleep(2)
+            output += shell.recv(99999).decode(errors='ignore')
 
-    output = ""
-    for cmd in cmd_set:
-        shell.send(cmd + "\n")
-        time.sleep(2)
-        output += shell.recv(99999).decode(errors='ignore')
+        shell.close()
 
-    client.close()
+    config = output.split(cmd_set[-1])[-1].strip()
+    # Same digest as ConfigBlob.digest, so it can be used to look up stored configs
+    config_hash = config_digest(config)
 
-    config = output.split(cmd_set[-1])[-1]
-    config_hash = hashlib.sha256(config.encode()).hexdigest()
-
-    return config.strip(), config_hash
+    return config, config_hash
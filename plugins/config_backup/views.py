@@ -1,27 +1,56 @@
-import os
-import difflib
+from django.http import HttpResponse, JsonResponse
 from django.views.generic import ListView, TemplateView
 from django.shortcuts import render, redirect, get_object_or_404
 from django.urls import reverse
 from django.utils.timezone import now
 from django.contrib import messages
+from django.db.models import BooleanField, ExpressionWrapper, Q
+from netbox.plugins import get_plugin_config
 from dcim.models import Device
-from .models import ConfigBackup
-from .utilities.backup_utils import backup_device_config
-from itertools import zip_longest
+from utilities.paginator import EnhancedPaginator, get_paginate_count
+from rq.job import JobStatus
+from .jobs import IN_FLIGHT, enqueue_manual_collection, get_manual_job
+from .models import ConfigBackup, DeviceBackupState
+from .utilities.diff_utils import diff_opcodes, build_diff_rows
+from .utilities.config_sections import diff_configs_by_section
+from .utilities.diff_cache import get_cached_diff, set_cached_diff, get_diff_cache_stats
+from .utilities.search import SEARCH_LIMIT, SEARCH_MAX_LIMIT, search_latest_configs
+from .utilities.prometheus import render_metrics
+from prometheus_client import CONTENT_TYPE_LATEST
+import re
+import time
 
 class DeviceConfigBackupView(ListView):
     model = ConfigBackup
     template_name = 'netbox_config_backup/configbackup.html'
     context_object_name = 'backups'
+    paginator_class = EnhancedPaginator
+
+    def get_paginate_by(self, queryset):
+        return get_paginate_count(self.request)
 
     def get_queryset(self):
-        return ConfigBackup.objects.filter(device_id=self.kwargs['device_id']).order_by('-created')
+        # Size, digest and line counts are columns; the config text itself is never loaded here.
+        # Rows without a config (disable/delete markers) stay in so the first row is the latest one.
+        return ConfigBackup.objects.filter(device_id=self.kwargs['device_id']).defer('config').annotate(
+            has_config=ExpressionWrapper(Q(blob__isnull=False) | ~Q(config=''), output_field=BooleanField())
+        ).order_by('-created', '-pk')
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['device'] = get_object_or_404(Device, pk=self.kwargs['device_id'])
-        context['latest'] = ConfigBackup.objects.filter(device=context['device']).order_by('-created').first()
+        page = context['page_obj']
+        rows = list(context['backups'])  # Evaluates the page once, the template reuses it
+        ConfigBackup.fill_line_changes(rows)
+        if page.number == 1:
+            context['latest'] = rows[0] if rows else None
+        else:
+            context['latest'] = DeviceBackupState.get_latest(context['device'].pk)
+        # The page polls collect_status while a Collect Now job is queued or running
+        job = get_manual_job(context['device'].pk)
+        context['collecting'] = job is not None and job.get_status() in IN_FLIGHT
+        # Polling gives up a minute after the job itself would have timed out
+        context['poll_timeout'] = get_plugin_config('netbox_config_backup', 'collection_job_timeout') + 60
         return context
 
 def collect_backup(request, device_id):
@@ -30,32 +59,32 @@ def collect_backup(request, device_id):
     if not ip:
         return redirect(reverse('plugins:netbox_config_backup:device_config_backups', kwargs={'device_id': device.id}))
 
-    username = os.getenv("DEVICE_BACKUP_USER")
-    password = os.getenv("DEVICE_BACKUP_PASSWORD")
-
-    config, status = backup_device_config(device, username, password)
-
-    ConfigBackup.objects.create(
-        device=device,
-        config=config or '',
-        last_status=status,
-        status='Collected' if config else f"Failed: {status}",
-        last_checked=now(),
-        collection_mode='MANUAL'
-    )
+    # SSH runs on an RQ worker, the request returns right away
+    enqueue_manual_collection(device.pk)
+    messages.info(request, f"Collection of {device.name} queued")
     return redirect(reverse('plugins:netbox_config_backup:device_config_backups', kwargs={'device_id': device.id}))
 
+def collect_status(request, device_id):
+    """Small JSON polled by the backups page until the queued collection has stored its row"""
+    device = get_object_or_404(Device, id=device_id)
+    job = get_manual_job(device.pk)
+    status = job.get_status() if job is not None else None
+    latest_id = DeviceBackupState.objects.filter(device_id=device.pk).values_list('latest_id', flat=True).first()
+    return JsonResponse({
+        'status': status.value if status else None,
+        'in_flight': status in IN_FLIGHT,
+        'latest': latest_id,
+        'error': "Collection job failed, see the RQ worker log" if status == JobStatus.FAILED else None,
+    })
+
 def enable_backup(request, device_id):
     device = get_object_or_404(Device, id=device_id)
     ip = device.primary_ip or device.oob_ip
     if not ip:
         return redirect(reverse('plugins:netbox_config_backup:device_config_backups', kwargs={'device_id': device.id}))
 
-    username = os.getenv("DEVICE_BACKUP_USER")
-    password = os.getenv("DEVICE_BACKUP_PASSWORD")
-
     # Get existing config (don't collect new one yet)
-    latest = ConfigBackup.objects.filter(device=device).order_by('-created').first()
+    latest = DeviceBackupState.get_latest(device.pk)
     
     if latest and latest.status in ['Collected', 'Backup Enabled']:
         # Update existing record to auto mode
@@ -65,16 +94,9 @@ def enable_backup(request, device_id):
         latest.last_checked = now()
         latest.save()
     else:
-        # Only collect new config if no suitable existing record
-        config, status = backup_device_config(device, username, password)
-        ConfigBackup.objects.create(
-            device=device,
-            config=config or '',
-            last_status=status,
-            status='Backup Enabled',
-            last_checked=now(),
-            collection_mode='AUTO'
-        )
+        # Only collect new config if no suitable existing record, in the background
+        enqueue_manual_collection(device.pk, 'AUTO')
+        messages.info(request, f"Collection of {device.name} queued")
 
     return redirect(reverse('plugins:netbox_config_backup:device_config_backups', kwargs={'device_id': device.id}))
 
@@ -126,35 +148,85 @@ class ConfigDiffView(TemplateView):
             context['error'] = "Select exactly 2 configs to compare"
             return context
 
-        config1 = get_object_or_404(ConfigBackup, pk=ids[0])
-        config2 = get_object_or_404(ConfigBackup, pk=ids[1])
-
-        lines1 = config1.config.strip().splitlines()
-        lines2 = config2.config.strip().splitlines()
-
-        sm = difflib.SequenceMatcher(None, lines1, lines2)
-        diff_blocks = []
-        left_line = 1
-        right_line = 1
-
-        for tag, i1, i2, j1, j2 in sm.get_opcodes():
-            max_lines = max(i2 - i1, j2 - j1)
-            for idx in range(max_lines):
-                l = lines1[i1+idx] if i1+idx < i2 else ""
-                r = lines2[j1+idx] if j1+idx < j2 else ""
-                diff_blocks.append({
-                    "left": l,
-                    "right": r,
-                    "tag": tag,
-                    "left_no": left_line if l else "",
-                    "right_no": right_line if r else ""
-                })
-                if l:
-                    left_line += 1
-                if r:
-                    right_line += 1
+        # Config text is only loaded on a cache miss
+        backups = ConfigBackup.objects.select_related('device__device_type__manufacturer').defer('config')
+        config1 = get_object_or_404(backups, pk=ids[0])
+        config2 = get_object_or_404(backups, pk=ids[1])
+
+        try:
+            diff_context = int(self.request.GET.get('context', get_plugin_config('netbox_config_backup', 'diff_context')))
+        except ValueError:
+            diff_context = get_plugin_config('netbox_config_backup', 'diff_context')
+        # 'sections' matches config blocks by header first, 'lines' is a plain line diff
+        diff_mode = 'lines' if self.request.GET.get('mode') == 'lines' else 'sections'
+        variant = f'{diff_mode}:{diff_context}'
+
+        diff_blocks = get_cached_diff(config1.config_hash, config2.config_hash, variant)
+        context['diff_cache_hit'] = diff_blocks is not None
+        if diff_blocks is None:
+            if diff_mode == 'sections':
+                vendor = config1.device.device_type.manufacturer.name.lower()
+                diff_blocks = diff_configs_by_section(
+                    config1.config, config1.config_hash,
+                    config2.config, config2.config_hash,
+                    vendor, diff_context
+                )
+            else:
+                lines1 = config1.config.strip().splitlines()
+                lines2 = config2.config.strip().splitlines()
+
+                # Only changed regions plus context are rendered, the rest is folded
+                diff_blocks = build_diff_rows(lines1, lines2, diff_opcodes(lines1, lines2), diff_context)
+            if diff_context >= 0:
+                # Full-file views are too large to be worth caching
+                set_cached_diff(
+                    config1.config_hash, config2.config_hash, variant, diff_blocks,
+                    get_plugin_config('netbox_config_backup', 'diff_cache_timeout')
+                )
 
         context['config1'] = config1
         context['config2'] = config2
         context['diff_blocks'] = diff_blocks
+        context['diff_context'] = diff_context
+        context['diff_mode'] = diff_mode
+        context['selected_ids'] = ids
+        context['diff_cache_stats'] = get_diff_cache_stats()
         return context
+
+class ConfigSearchView(TemplateView):
+    template_name = 'netbox_config_backup/config_search.html'
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        query = self.request.GET.get('q', '').strip()
+        regex = self.request.GET.get('regex') == 'on'
+        context['query'] = query
+        context['regex'] = regex
+        if not query:
+            return context
+
+        if regex:
+            try:
+                re.compile(query)
+            except re.error as e:
+                context['error'] = f"Invalid regular expression: {e}"
+                return context
+
+        try:
+            limit = max(1, min(int(self.request.GET.get('limit', SEARCH_LIMIT)), SEARCH_MAX_LIMIT))
+        except ValueError:
+            limit = SEARCH_LIMIT
+        started = time.monotonic()
+        context['results'], context['truncated'] = search_latest_configs(query, regex=regex, limit=limit)
+        context['elapsed'] = time.monotonic() - started
+        context['limit'] = limit
+        context['max_limit'] = SEARCH_MAX_LIMIT
+        if limit < SEARCH_MAX_LIMIT:
+            more = self.request.GET.copy()
+            more['limit'] = SEARCH_MAX_LIMIT
+            context['more_url'] = f'?{more.urlencode()}'
+        return context
+
+
+def prometheus_metrics(request):
+    return HttpResponse(render_metrics(), content_type=CONTENT_TYPE_LATEST)